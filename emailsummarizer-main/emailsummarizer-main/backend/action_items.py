@@ -0,0 +1,185 @@
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+# Normalizes the action item shapes we see in practice ({task, deadline} dicts
+# from the LLM, plain strings from mock data) and parses deadlines into
+# datetimes so they can be indexed and range-queried.
+
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+WEEKDAYS = {
+    "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3,
+    "friday": 4, "saturday": 5, "sunday": 6,
+}
+EMPTY_DEADLINES = {"", "none", "n/a", "na", "null", "not specified", "unspecified", "tbd", "-"}
+
+# Whole month names or abbreviations only, so "5 decisions" or "3 marketing plans" aren't dates
+_MONTH_RE = (
+    r"\b(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+    r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b\.?"
+)
+_ISO_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2}))?")
+_SLASH_RE = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b")
+# In free task text a bare "1/2" is as likely a fraction as a date; there it
+# needs a year or a deadline word in front of it
+_TASK_SLASH_RE = re.compile(r"(?:\b(by|due|before|until|on)\s+)?" + _SLASH_RE.pattern, re.I)
+_MONTH_DAY_RE = re.compile(_MONTH_RE + r"\s+(\d{1,2})(?:st|nd|rd|th)?\b(?:,?\s+(\d{4}))?", re.I)
+_DAY_MONTH_RE = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?" + _MONTH_RE + r"(?:,?\s+(\d{4}))?", re.I)
+_WEEKDAY_RE = re.compile(r"\b(?:(next|this)\s+)?(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b", re.I)
+_TIME_RE = re.compile(r"\b(\d{1,2})(?::(\d{2}))?\s*([ap])\.?m\.?\b", re.I)
+
+
+def normalize_action_items(raw: Any) -> List[Dict[str, Optional[str]]]:
+    """Returns action items as a list of {"task", "deadline_text"} dicts."""
+    if not raw:
+        return []
+    if isinstance(raw, (str, dict)):
+        raw = [raw]
+    items = []
+    for item in raw:
+        if isinstance(item, dict):
+            task = str(item.get("task") or "").strip()
+            deadline_text = str(item.get("deadline") or "").strip()
+        else:
+            task = str(item).strip()
+            deadline_text = ""
+        if not task:
+            continue
+        if deadline_text.lower() in EMPTY_DEADLINES:
+            deadline_text = ""
+        items.append({"task": task, "deadline_text": deadline_text or None})
+    return items
+
+
+def _end_of_day(day: datetime) -> datetime:
+    return day.replace(hour=23, minute=59, second=0, microsecond=0)
+
+
+def _with_year(reference: datetime, month: int, day: int, year: Optional[str]) -> Optional[datetime]:
+    try:
+        if year:
+            year_value = int(year)
+            if year_value < 100:
+                year_value += 2000
+            return datetime(year_value, month, day)
+        candidate = datetime(reference.year, month, day)
+    except ValueError:
+        return None
+    # "December 15th" in a November email means this year; "January 5th" in
+    # a December email means next year.
+    if candidate < reference - timedelta(days=183):
+        candidate = candidate.replace(year=candidate.year + 1)
+    return candidate
+
+
+def _find_date(text: str, reference: datetime, in_task: bool = False) -> Optional[datetime]:
+    lowered = text.lower()
+
+    match = _ISO_RE.search(text)
+    if match:
+        year, month, day, hour, minute = match.groups()
+        try:
+            parsed = datetime(int(year), int(month), int(day))
+            if hour == "24" and minute == "00":
+                # "T24:00" is the end of that day
+                return _end_of_day(parsed)
+            if hour:
+                parsed = parsed.replace(hour=int(hour), minute=int(minute))
+        except ValueError:
+            parsed = None # Out-of-range date or time: not a usable ISO deadline
+        if parsed:
+            return parsed
+
+    match = _MONTH_DAY_RE.search(text)
+    if match:
+        parsed = _with_year(reference, MONTHS[match.group(1).lower()[:3]], int(match.group(2)), match.group(3))
+        if parsed:
+            return parsed
+
+    match = _DAY_MONTH_RE.search(text)
+    if match:
+        parsed = _with_year(reference, MONTHS[match.group(2).lower()[:3]], int(match.group(1)), match.group(3))
+        if parsed:
+            return parsed
+
+    if in_task:
+        match = next((m for m in _TASK_SLASH_RE.finditer(text) if m.group(1) or m.group(4)), None)
+        slash = match.groups()[1:] if match else None
+    else:
+        match = _SLASH_RE.search(text)
+        slash = match.groups() if match else None
+    if slash:
+        # US month/day ordering, matching the senders we ingest
+        parsed = _with_year(reference, int(slash[0]), int(slash[1]), slash[2])
+        if parsed:
+            return parsed
+
+    today = reference.replace(hour=0, minute=0, second=0, microsecond=0)
+    if "tomorrow" in lowered:
+        return today + timedelta(days=1)
+    if re.search(r"\b(today|tonight|eod|end of (the )?day)\b", lowered):
+        return today
+    if re.search(r"\bend of (the |this )?week\b|\beow\b", lowered):
+        return today + timedelta(days=(4 - today.weekday()) % 7)
+    if re.search(r"\bend of (the |this )?month\b|\beom\b", lowered):
+        next_month = (today.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return next_month - timedelta(days=1)
+    if re.search(r"\bnext week\b", lowered):
+        return today + timedelta(days=7 - today.weekday())
+
+    match = _WEEKDAY_RE.search(text)
+    if match:
+        qualifier, weekday = match.group(1), WEEKDAYS[match.group(2).lower()]
+        days_ahead = (weekday - today.weekday()) % 7 or 7
+        if qualifier and qualifier.lower() == "next" and days_ahead < 7 - today.weekday():
+            days_ahead += 7
+        return today + timedelta(days=days_ahead)
+    return None
+
+
+def parse_deadline(text: Optional[str], reference: Optional[datetime] = None, in_task: bool = False) -> Optional[datetime]:
+    """Parses a free-text deadline relative to `reference` (usually the email timestamp).
+
+    Dates without an explicit time resolve to the end of that day. `in_task`
+    marks text that is a task description rather than a deadline field, where
+    ambiguous numeric dates are only accepted with a year or a deadline word.
+    """
+    if not text:
+        return None
+    reference = (reference or datetime.utcnow()).replace(tzinfo=None)
+    day = _find_date(text, reference, in_task)
+    if not day:
+        return None
+    if day.hour or day.minute:
+        return day
+    time_match = _TIME_RE.search(text)
+    if time_match:
+        hour = int(time_match.group(1)) % 12
+        if time_match.group(3).lower() == "p":
+            hour += 12
+        try:
+            return day.replace(hour=hour, minute=int(time_match.group(2) or 0))
+        except ValueError:
+            return None # e.g. "5:75pm"
+    return _end_of_day(day)
+
+
+def build_action_item_rows(email_id: str, raw: Any, reference: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Builds ActionItem column values for an email's raw action items."""
+    rows = []
+    for item in normalize_action_items(raw):
+        # Plain-string items usually carry their deadline inline ("... by December 1st")
+        if item["deadline_text"]:
+            deadline = parse_deadline(item["deadline_text"], reference)
+        else:
+            deadline = parse_deadline(item["task"], reference, in_task=True)
+        rows.append({
+            "email_id": email_id,
+            "task": item["task"],
+            "deadline_text": item["deadline_text"],
+            "deadline": deadline,
+        })
+    return rows
@@ -1,9 +1,5 @@
 import os
 from pathlib import Path
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 
 # OAuth 2.0 scopes for Gmail API
 SCOPES = [
@@ -17,6 +13,12 @@ CLIENT_SECRETS_FILE = str(BASE_DIR / 'credentials.json')
 TOKEN_PATH = str(BASE_DIR / 'token.json')
 
 def get_gmail_service():
+    # Imported here so the Google client libraries aren't loaded until Gmail is used
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from googleapiclient.discovery import build
+
     creds = None
     if os.path.exists(TOKEN_PATH):
         creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import uuid
+import weakref
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from store import Store
+
+# Server-side chat history. Recent turns are sent to the LLM verbatim; once
+# they exceed CHAT_HISTORY_TOKEN_BUDGET the oldest are folded into a running
+# summary, so each prompt stays bounded however long the conversation runs.
+
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))
+CHAT_KEEP_RECENT_MESSAGES = int(os.getenv("CHAT_KEEP_RECENT_MESSAGES", "4"))
+CHAT_SESSION_CACHE_SIZE = int(os.getenv("CHAT_SESSION_CACHE_SIZE", "256"))
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting
+    return len(text or "") // 4 + 1
+
+
+class ChatSessionState:
+    def __init__(self, session_id: str, summary: Optional[str] = None, messages: Optional[List[Dict]] = None):
+        self.id = session_id
+        self.summary = summary
+        self.messages = messages or [] # Unfolded turns: {"id", "role", "content"}
+
+    @property
+    def history(self) -> List[Dict[str, str]]:
+        return [{"role": m["role"], "content": m["content"]} for m in self.messages]
+
+    def history_tokens(self) -> int:
+        return sum(estimate_tokens(m["content"]) for m in self.messages)
+
+
+class ChatSessionManager:
+    """Loads and updates chat sessions through the Store, fronted by an LRU cache."""
+
+    def __init__(self, capacity: int = CHAT_SESSION_CACHE_SIZE):
+        self.capacity = capacity
+        self._cache: "OrderedDict[str, ChatSessionState]" = OrderedDict()
+        self._compaction_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def _remember(self, state: ChatSessionState) -> ChatSessionState:
+        self._cache[state.id] = state
+        self._cache.move_to_end(state.id)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+        return state
+
+    async def get_or_create(self, store: Store, session_id: Optional[str], seed_history: Optional[List[Dict]] = None) -> ChatSessionState:
+        if session_id and session_id in self._cache:
+            self._cache.move_to_end(session_id)
+            return self._cache[session_id]
+        if session_id:
+            session = await store.get_chat_session(session_id)
+            if session:
+                messages = await store.get_unfolded_messages(session_id)
+                return self._remember(ChatSessionState(
+                    session.id,
+                    session.summary,
+                    [{"id": m.id, "role": m.role, "content": m.content} for m in messages],
+                ))
+        state = ChatSessionState(session_id or uuid.uuid4().hex)
+        await store.create_chat_session(state.id)
+        if seed_history:
+            # Clients that still send their full history start a session from it
+            await self.append(store, state, [
+                {"role": m.get("role", "user"), "content": m.get("content", "")} for m in seed_history
+            ])
+        return self._remember(state)
+
+    async def append(self, store: Store, state: ChatSessionState, messages: List[Dict]):
+        rows = await store.add_chat_messages(state.id, messages)
+        state.messages.extend({"id": r.id, "role": r.role, "content": r.content} for r in rows)
+        self._remember(state)
+
+    def needs_compaction(self, state: ChatSessionState) -> bool:
+        return state.history_tokens() > CHAT_HISTORY_TOKEN_BUDGET and len(state.messages) > CHAT_KEEP_RECENT_MESSAGES
+
+    async def compact(self, store: Store, state: ChatSessionState,
+                      summarize: Callable[[Optional[str], List[Dict]], Awaitable[str]]) -> bool:
+        """Folds all but the most recent messages into the session summary.
+
+        If `summarize` raises, nothing is folded and the turns stay as they are.
+        """
+        lock = self._compaction_locks.get(state.id)
+        if lock is None:
+            lock = self._compaction_locks[state.id] = asyncio.Lock()
+        # One compaction per session at a time; a second one waits and then
+        # usually finds nothing left to fold
+        async with lock:
+            if not self.needs_compaction(state):
+                return False
+            folded = state.messages[:-CHAT_KEEP_RECENT_MESSAGES] if CHAT_KEEP_RECENT_MESSAGES else list(state.messages)
+            summary = await summarize(state.summary, [{"role": m["role"], "content": m["content"]} for m in folded])
+            await store.fold_chat_messages(state.id, [m["id"] for m in folded], summary)
+            folded_ids = {m["id"] for m in folded}
+            state.summary = summary
+            state.messages = [m for m in state.messages if m["id"] not in folded_ids]
+            return True
+
+
+chat_sessions = ChatSessionManager()
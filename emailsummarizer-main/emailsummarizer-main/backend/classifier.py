@@ -0,0 +1,225 @@
+import os
+import re
+import zlib
+from collections import Counter, defaultdict, deque
+from typing import Dict, List, Optional, Tuple
+
+# Local fast path for categorization: a multinomial naive Bayes model over
+# hashed tokens, trained on categories the LLM has already assigned, plus
+# sender/header heuristics. Confident predictions skip the Gemini call.
+#
+# Naive Bayes posteriors are summed over hundreds of tokens and come out near
+# 1.0 whatever the model has learned, so they are not used as confidence.
+# Instead each LLM-labelled email is first scored by the model (before it
+# learns from it), and the model's confidence is its recent agreement rate
+# with the LLM on emails where it had a clear per-token margin.
+
+CATEGORIES = ["Important", "Newsletter", "Spam", "To-Do"]
+LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_ENABLED", "true").lower() in ("1", "true", "yes")
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.9"))
+# Naive Bayes is not trusted until it has seen this many labelled emails
+LOCAL_CLASSIFIER_MIN_SAMPLES = int(os.getenv("LOCAL_CLASSIFIER_MIN_SAMPLES", "30"))
+# Best-vs-runner-up log-likelihood gap per token below which the model abstains
+LOCAL_CLASSIFIER_MIN_MARGIN = float(os.getenv("LOCAL_CLASSIFIER_MIN_MARGIN", "0.05"))
+# Agreement with the LLM is measured over this many recent checks, and not trusted below the minimum
+LOCAL_CLASSIFIER_AGREEMENT_WINDOW = int(os.getenv("LOCAL_CLASSIFIER_AGREEMENT_WINDOW", "200"))
+LOCAL_CLASSIFIER_MIN_CHECKS = int(os.getenv("LOCAL_CLASSIFIER_MIN_CHECKS", "20"))
+# Every Nth confident local answer still goes to the LLM so agreement keeps being measured
+LOCAL_CLASSIFIER_AUDIT_EVERY = int(os.getenv("LOCAL_CLASSIFIER_AUDIT_EVERY", "20"))
+# Comma-separated sender rules, e.g. "newsletter@=Newsletter,@github.com=Newsletter"
+KNOWN_SENDERS = os.getenv("KNOWN_SENDERS", "")
+
+HASH_FEATURES = 2 ** 16
+BODY_FEATURE_CHARS = 2000
+SENDER_HISTORY_MIN = 3
+
+_CATEGORY_PATTERNS = [
+    (category, re.compile(pattern, re.I))
+    for category, pattern in [
+        ("Important", r"\bimportant\b"),
+        ("Newsletter", r"\bnewsletters?\b"),
+        ("Spam", r"\bspam\b"),
+        ("To-Do", r"\bto[\s-]?do\b"),
+    ]
+]
+_TOKEN_RE = re.compile(r"[a-z][a-z0-9'-]{1,30}")
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_BULK_PRECEDENCE = {"bulk", "list", "junk"}
+
+np = None # numpy is imported on first use to keep it off the startup path
+
+
+def _load_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+
+def normalize_category(text: Optional[str]) -> Optional[str]:
+    """Maps free-form LLM output ("To-Do\\nThe sender asks...") to a canonical category."""
+    if not text:
+        return None
+    best, best_position = None, None
+    for category, pattern in _CATEGORY_PATTERNS:
+        match = pattern.search(text)
+        if match and (best_position is None or match.start() < best_position):
+            best, best_position = category, match.start()
+    return best
+
+
+def sender_address(sender: Optional[str]) -> str:
+    match = _EMAIL_RE.search(sender or "")
+    return match.group(0).lower() if match else (sender or "").strip().lower()
+
+
+def _parse_known_senders(config: str) -> List[Tuple[str, str]]:
+    rules = []
+    for rule in config.split(","):
+        pattern, _, category = rule.partition("=")
+        category = normalize_category(category)
+        if pattern.strip() and category:
+            rules.append((pattern.strip().lower(), category))
+    return rules
+
+
+class LocalClassifier:
+    def __init__(self, n_features: int = HASH_FEATURES):
+        self.n_features = n_features
+        self.feature_counts = None # Allocated by _ensure_model()
+        self.class_counts = None
+        self.feature_totals = None
+        self.sender_history: Dict[str, Counter] = defaultdict(Counter)
+        self.known_senders = _parse_known_senders(KNOWN_SENDERS)
+        self.trained_samples = 0
+        self.agreement = deque(maxlen=LOCAL_CLASSIFIER_AGREEMENT_WINDOW) # Model answer matched the LLM label?
+        self.confident_answers = 0 # Every LOCAL_CLASSIFIER_AUDIT_EVERY-th one is escalated anyway
+        self.local_hits = 0
+        self.escalations = 0
+
+    def _ensure_model(self):
+        if self.feature_counts is None:
+            _load_numpy()
+            self.feature_counts = np.zeros((len(CATEGORIES), self.n_features), dtype=np.float64)
+            self.class_counts = np.zeros(len(CATEGORIES), dtype=np.float64)
+            self.feature_totals = np.zeros(len(CATEGORIES), dtype=np.float64)
+
+    def _features(self, sender: str, subject: str, body: str, headers: Optional[Dict]) -> Tuple["np.ndarray", "np.ndarray"]:
+        address = sender_address(sender)
+        tokens = [f"s:{t}" for t in _TOKEN_RE.findall((subject or "").lower())]
+        tokens += _TOKEN_RE.findall((body or "")[:BODY_FEATURE_CHARS].lower())
+        tokens.append(f"from:{address}")
+        tokens.append(f"domain:{address.rpartition('@')[2]}")
+        for name in (headers or {}):
+            tokens.append(f"h:{name.lower()}")
+        indices = np.fromiter(
+            (zlib.crc32(t.encode("utf-8")) % self.n_features for t in tokens), dtype=np.int64, count=len(tokens)
+        )
+        return np.unique(indices, return_counts=True)
+
+    def learn(self, sender: str, subject: str, body: str, headers: Optional[Dict], category_text: str) -> bool:
+        """Adds one labelled email to the model; training is incremental, so this is cheap."""
+        category = normalize_category(category_text)
+        if not category:
+            return False
+        label = CATEGORIES.index(category)
+        self._ensure_model()
+        indices, counts = self._features(sender, subject, body, headers)
+        # Score the email before learning from it, so agreement measures unseen emails
+        prediction = self._best_class(indices, counts)
+        if prediction and prediction[1] >= LOCAL_CLASSIFIER_MIN_MARGIN:
+            self.agreement.append(prediction[0] == label)
+        self.feature_counts[label, indices] += counts
+        self.feature_totals[label] += counts.sum()
+        self.class_counts[label] += 1
+        self.sender_history[sender_address(sender)][category] += 1
+        self.trained_samples += 1
+        return True
+
+    def _header_rule(self, headers: Optional[Dict]) -> Optional[Tuple[str, float]]:
+        lowered = {name.lower(): str(value).lower() for name, value in (headers or {}).items()}
+        if "list-unsubscribe" in lowered and (
+            "list-id" in lowered or lowered.get("precedence") in _BULK_PRECEDENCE
+        ):
+            return "Newsletter", 0.95
+        return None
+
+    def _sender_rule(self, sender: str) -> Optional[Tuple[str, float]]:
+        address = sender_address(sender)
+        for pattern, category in self.known_senders:
+            if pattern in address:
+                return category, 1.0
+        history = self.sender_history.get(address)
+        if history:
+            total = sum(history.values())
+            category, count = history.most_common(1)[0]
+            if total >= SENDER_HISTORY_MIN:
+                # Laplace-style discount so a short unanimous history isn't treated as certain
+                return category, count / (total + 1)
+        return None
+
+    def _best_class(self, indices: "np.ndarray", counts: "np.ndarray") -> Optional[Tuple[int, float]]:
+        """Returns (class index, log-likelihood margin over the runner-up per token)."""
+        if self.trained_samples < LOCAL_CLASSIFIER_MIN_SAMPLES or not counts.sum():
+            return None
+        log_likelihood = np.log(self.feature_counts[:, indices] + 1.0) - np.log(self.feature_totals + self.n_features)[:, None]
+        log_prior = np.log((self.class_counts + 1.0) / (self.class_counts.sum() + len(CATEGORIES)))
+        scores = log_prior + log_likelihood @ counts
+        runner_up, best = np.argsort(scores)[-2:]
+        return int(best), float((scores[best] - scores[runner_up]) / counts.sum())
+
+    def agreement_rate(self) -> Optional[float]:
+        """Smoothed share of recent checks where the model matched the LLM; None until there are enough."""
+        if len(self.agreement) < LOCAL_CLASSIFIER_MIN_CHECKS:
+            return None
+        return sum(self.agreement) / (len(self.agreement) + 1)
+
+    def _naive_bayes(self, sender: str, subject: str, body: str, headers: Optional[Dict]) -> Optional[Tuple[str, float]]:
+        if self.trained_samples < LOCAL_CLASSIFIER_MIN_SAMPLES:
+            return None
+        prediction = self._best_class(*self._features(sender, subject, body, headers))
+        confidence = self.agreement_rate()
+        if not prediction or prediction[1] < LOCAL_CLASSIFIER_MIN_MARGIN or confidence is None:
+            return None
+        return CATEGORIES[prediction[0]], confidence
+
+    def predict(self, sender: str, subject: str, body: str, headers: Optional[Dict] = None) -> Optional[Tuple[str, float]]:
+        """Returns the most confident (category, confidence) from the rules and the model, if any."""
+        candidates = [
+            candidate for candidate in (
+                self._sender_rule(sender),
+                self._header_rule(headers),
+                self._naive_bayes(sender, subject, body, headers),
+            ) if candidate
+        ]
+        return max(candidates, key=lambda c: c[1]) if candidates else None
+
+    def classify(self, sender: str, subject: str, body: str, headers: Optional[Dict] = None) -> Optional[str]:
+        """Returns a category when confident enough to skip the LLM, else None (and counts an escalation)."""
+        if LOCAL_CLASSIFIER_ENABLED:
+            prediction = self.predict(sender, subject, body, headers)
+            if prediction and prediction[1] >= LOCAL_CLASSIFIER_THRESHOLD:
+                self.confident_answers += 1
+                if self.confident_answers % LOCAL_CLASSIFIER_AUDIT_EVERY:
+                    self.local_hits += 1
+                    return prediction[0]
+        self.escalations += 1
+        return None
+
+    def stats(self) -> Dict:
+        decisions = self.local_hits + self.escalations
+        return {
+            "enabled": LOCAL_CLASSIFIER_ENABLED,
+            "threshold": LOCAL_CLASSIFIER_THRESHOLD,
+            "trained_samples": self.trained_samples,
+            "model_agreement": round(self.agreement_rate(), 3) if self.agreement_rate() is not None else None,
+            "agreement_checks": len(self.agreement),
+            "local_hits": self.local_hits,
+            "escalations": self.escalations,
+            "llm_calls_saved": self.local_hits,
+            "local_hit_rate": round(self.local_hits / decisions, 3) if decisions else 0.0,
+        }
+
+
+classifier = LocalClassifier()
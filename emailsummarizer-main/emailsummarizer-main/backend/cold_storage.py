@@ -0,0 +1,35 @@
+import os
+import zlib
+from typing import Tuple
+
+try:
+    import zstandard
+except ImportError: # Optional; zlib is always available
+    zstandard = None
+
+# Bodies of emails older than COLD_STORAGE_AFTER_DAYS are compressed into the
+# email_bodies_cold table by a periodic compaction job. Unset (or 0) disables
+# the job; POST /storage/compact still works on demand.
+COLD_STORAGE_AFTER_DAYS = int(os.getenv("COLD_STORAGE_AFTER_DAYS", "0"))
+COLD_STORAGE_INTERVAL_SECONDS = int(os.getenv("COLD_STORAGE_INTERVAL_SECONDS", "3600"))
+COLD_STORAGE_BATCH_SIZE = int(os.getenv("COLD_STORAGE_BATCH_SIZE", "500"))
+
+DEFAULT_CODEC = "zstd" if zstandard else "zlib"
+
+
+def compress_text(text: str) -> Tuple[str, bytes]:
+    """Returns (codec, compressed bytes)."""
+    raw = (text or "").encode("utf-8")
+    if DEFAULT_CODEC == "zstd":
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(raw)
+    return "zlib", zlib.compress(raw, 9)
+
+
+def decompress_text(codec: str, data: bytes) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Email body was compressed with zstd but the zstandard package is not installed")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        raw = zlib.decompress(data)
+    return raw.decode("utf-8")
@@ -1,10 +1,15 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, Text, LargeBinary, Index, event, inspect, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.types import TypeDecorator, TEXT # Import TypeDecorator and TEXT
+from contextlib import asynccontextmanager
 from datetime import datetime
 import os
 import json
-from typing import List, Dict, Any
+import hashlib
+from typing import AsyncIterator, List, Dict, Any
 
 # Custom type for JSON data in SQLite
 class SQLiteJSON(TypeDecorator):
@@ -24,10 +29,34 @@ class SQLiteJSON(TypeDecorator):
 
 # Database connection URL from environment variable (for SQLite)
 # SQLite database file will be created in the backend directory
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./email_agent.db")
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./email_agent.db")
+# Accept plain sqlite:// URLs from existing .env files and run them on the async driver
+if DATABASE_URL.startswith("sqlite://"):
+    DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}) # Needed for SQLite with FastAPI
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Bounded pool: requests wait up to DB_POOL_TIMEOUT seconds for a connection
+# instead of opening an unbounded number of them.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+engine = create_async_engine(
+    DATABASE_URL,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+)
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers proceed while a background task is committing
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
+SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 class Email(Base):
@@ -43,10 +72,95 @@ class Email(Base):
     action_items = Column(SQLiteJSON, nullable=True) # Use custom JSON type
     summary = Column(Text, nullable=True)
     processed = Column(Boolean, default=False)
+    headers = Column(SQLiteJSON, nullable=True) # Selected Gmail headers (List-Unsubscribe, In-Reply-To, ...)
+    thread_id = Column(String, nullable=True, index=True) # Gmail threadId
+    simhash = Column(BigInteger, nullable=True) # Near-duplicate fingerprint, see dedup.py
+    number_digest = Column(String, nullable=True) # Digest of the digits simhash masks, see dedup.py
+    duplicate_of = Column(String, nullable=True) # Email whose category/summary were reused
+    category_source = Column(String, nullable=True) # "llm", "local", "duplicate" or "fallback" (no model answered); NULL for imported labels
+    archived = Column(Boolean, default=False, index=True) # Body moved to email_bodies_cold
+    source = Column(String, nullable=True) # "gmail" for synced messages; NULL for mock/imported
+    model_info = Column(SQLiteJSON, nullable=True) # Model that served each LLM call, e.g. {"categorize": "gemini-2.0-flash-lite"}
 
     def __repr__(self):
         return f"<Email(id='{self.id}', subject='{self.subject}')>"
 
+class EmailBodyCold(Base):
+    __tablename__ = "email_bodies_cold"
+
+    email_id = Column(String, primary_key=True, index=True)
+    codec = Column(String) # "zlib" or "zstd", see cold_storage.py
+    body = Column(LargeBinary)
+    original_size = Column(Integer)
+    compressed_size = Column(Integer)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<EmailBodyCold(email_id='{self.email_id}', codec='{self.codec}')>"
+
+class EmailThread(Base):
+    __tablename__ = "threads"
+
+    id = Column(String, primary_key=True, index=True) # Gmail threadId
+    summary = Column(Text, nullable=True) # Running summary of the whole conversation
+    prior_summary = Column(Text, nullable=True) # Summary before the last message was folded in
+    last_email_id = Column(String, nullable=True)
+    last_timestamp = Column(DateTime, nullable=True)
+    message_count = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<EmailThread(id='{self.id}', message_count={self.message_count})>"
+
+class ActionItem(Base):
+    __tablename__ = "action_items"
+    __table_args__ = (
+        Index("ix_action_items_deadline_email", "deadline", "email_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    email_id = Column(String, index=True) # Email the task was extracted from
+    task = Column(Text)
+    deadline_text = Column(String, nullable=True) # Deadline as written, e.g. "end of this week"
+    deadline = Column(DateTime, nullable=True) # Parsed deadline, indexed for range queries
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ActionItem(id={self.id}, email_id='{self.email_id}', deadline='{self.deadline}')>"
+
+class ChatSession(Base):
+    __tablename__ = "chat_sessions"
+
+    id = Column(String, primary_key=True, index=True)
+    summary = Column(Text, nullable=True) # Rolling summary of turns folded out of the prompt
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ChatSession(id='{self.id}')>"
+
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String, index=True)
+    role = Column(String) # "user" or "agent"
+    content = Column(Text)
+    folded = Column(Boolean, default=False) # True once covered by ChatSession.summary
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ChatMessage(id={self.id}, session_id='{self.session_id}', role='{self.role}')>"
+
+class AppMeta(Base):
+    __tablename__ = "app_meta"
+
+    key = Column(String, primary_key=True) # e.g. "schema_version", "prompt_seed_version"
+    value = Column(Text)
+
+    def __repr__(self):
+        return f"<AppMeta(key='{self.key}', value='{self.value}')>"
+
 class Prompt(Base):
     __tablename__ = "prompts"
 
@@ -73,25 +187,31 @@ class Draft(Base):
     def __repr__(self):
         return f"<Draft(id={self.id}, subject='{self.subject}')>"
 
-def create_db_tables():
-    """Creates all defined database tables if they do not already exist."""
-    print("Creating database tables...")
-    Base.metadata.create_all(bind=engine)
-    print("Database tables created (if they didn't exist).")
+class PrecomputedDraft(Base):
+    __tablename__ = "precomputed_drafts"
 
-def seed_initial_prompts():
-    from sqlalchemy.orm import Session
-    db = SessionLocal()
-    try:
-        default_prompts = [
-            {"name": "categorization", "template": """Categorize emails into: Important, Newsletter, Spam, To-Do.
+    email_id = Column(String, primary_key=True, index=True)
+    prompt_version = Column(String) # Hash of the auto_reply template the draft was generated with
+    email_version = Column(String) # speculative.email_version() of the email it was generated from
+    instructions = Column(Text)
+    subject = Column(String)
+    body = Column(Text)
+    suggested_follow_ups = Column(SQLiteJSON, nullable=True)
+    draft_metadata = Column(SQLiteJSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<PrecomputedDraft(email_id='{self.email_id}', prompt_version='{self.prompt_version}')>"
+
+DEFAULT_PROMPTS = [
+    {"name": "categorization", "template": """Categorize emails into: Important, Newsletter, Spam, To-Do.
 To-Do emails must include a direct request requiring user action.
 Provide a brief plain text explanation (no markdown formatting, no asterisks or special characters).
 Return ONLY the category name and explanation, nothing else."""},
-            {"name": "action_item", "template": """Extract tasks from the email. Respond in JSON format only:
+    {"name": "action_item", "template": """Extract tasks from the email. Respond in JSON format only:
 { "task": "...", "deadline": "..." }.
 Use plain text in the task field, no markdown formatting."""},
-            {"name": "auto_reply", "template": """Draft a polite and professional reply to this email, incorporating user instructions.
+    {"name": "auto_reply", "template": """Draft a polite and professional reply to this email, incorporating user instructions.
 Additionally, suggest 2-3 concise follow-up actions related to the email, and provide JSON metadata including the email's category and any extracted action items.
 Respond in JSON format as follows:
 
@@ -103,32 +223,118 @@ Respond in JSON format as follows:
         "action_items": [{"task": "[Task 1]", "deadline": "[Deadline 1]"}]
     }
 }"""},
-        ]
+]
 
-        for prompt_data in default_prompts:
-            existing_prompt = db.query(Prompt).filter(Prompt.name == prompt_data["name"]).first()
+async def create_db_tables():
+    """Creates all defined database tables if they do not already exist."""
+    print("Creating database tables...")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+    print("Database tables created (if they didn't exist).")
+
+def _add_missing_columns(conn):
+    """create_all() never alters existing tables; add new nullable columns (and their indexes) in place."""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        missing = [column for column in table.columns if column.name not in existing]
+        for column in missing:
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+            print(f"Added column {table.name}.{column.name}")
+        if missing:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+async def seed_initial_prompts():
+    db = SessionLocal()
+    try:
+
+        for prompt_data in DEFAULT_PROMPTS:
+            result = await db.execute(select(Prompt).filter(Prompt.name == prompt_data["name"]))
+            existing_prompt = result.scalars().first()
             if existing_prompt:
                 if existing_prompt.template != prompt_data["template"]:
                     existing_prompt.template = prompt_data["template"]
-                    db.commit()
+                    await db.commit()
                     print(f"Updating prompt: {prompt_data['name']}")
                 else:
                     print(f"Prompt '{prompt_data['name']}' already up-to-date.")
             else:
                 prompt = Prompt(name=prompt_data["name"], template=prompt_data["template"])
                 db.add(prompt)
-                db.commit()
+                await db.commit()
                 print(f"Seeding new prompt: {prompt_data['name']}")
+        return True
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error seeding initial prompts: {e}")
+        return False
     finally:
-        db.close()
+        await db.close()
+
+def schema_version() -> str:
+    """Fingerprint of the declared tables and columns; changes whenever a model changes."""
+    columns = sorted(
+        f"{table.name}.{column.name}:{column.type}"
+        for table in Base.metadata.sorted_tables for column in table.columns
+    )
+    return hashlib.sha256("\n".join(columns).encode("utf-8")).hexdigest()[:16]
+
+def prompt_seed_version() -> str:
+    return hashlib.sha256(json.dumps(DEFAULT_PROMPTS, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+async def _get_meta() -> Dict[str, str]:
+    async with session_scope() as db:
+        try:
+            result = await db.execute(select(AppMeta))
+        except OperationalError:
+            return {} # Fresh database: app_meta doesn't exist yet
+        return {row.key: row.value for row in result.scalars().all()}
 
-def get_db():
+async def _set_meta(key: str, value: str):
+    async with session_scope() as db:
+        await db.merge(AppMeta(key=key, value=value))
+        await db.commit()
+
+async def initialize_database() -> bool:
+    """Fast-path startup: one SELECT when nothing changed, the full create/seed only when versions differ.
+
+    Returns True when the schema was (re)applied, so callers can run one-off backfills.
+    """
+    meta = await _get_meta()
+    current_schema = schema_version()
+    schema_changed = meta.get("schema_version") != current_schema
+    if schema_changed:
+        await create_db_tables()
+        await _set_meta("schema_version", current_schema)
+    else:
+        print("Database schema up-to-date; skipping table creation.")
+
+    current_prompts = prompt_seed_version()
+    if meta.get("prompt_seed_version") != current_prompts:
+        if await seed_initial_prompts():
+            await _set_meta("prompt_seed_version", current_prompts)
+    else:
+        print("Default prompts up-to-date; skipping seeding.")
+    return schema_changed
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """Request-scoped session dependency for FastAPI endpoints."""
+    async with session_scope() as db:
+        yield db
+
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[AsyncSession]:
+    """Short-lived session for background work; rolled back on error and always closed."""
     db = SessionLocal()
     try:
         yield db
+    except Exception:
+        await db.rollback()
+        raise
     finally:
-        db.close()
+        await db.close()
+
 
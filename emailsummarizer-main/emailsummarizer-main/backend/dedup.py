@@ -0,0 +1,66 @@
+import hashlib
+import os
+import re
+from typing import Iterable, List
+
+# 64-bit SimHash fingerprints for spotting near-identical emails (recurring
+# notifications, digests) whose LLM results can be reused.
+
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", "3"))
+SIMHASH_BITS = 64
+_MASK = (1 << SIMHASH_BITS) - 1
+
+_URL_RE = re.compile(r"https?://\S+|www\.\S+")
+_DIGIT_RE = re.compile(r"\d")
+_NUMBER_RE = re.compile(r"\d+")
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def _tokens(text: str) -> List[str]:
+    text = _URL_RE.sub(" url ", text.lower())
+    # Order numbers, amounts and dates vary between otherwise identical notifications
+    text = _DIGIT_RE.sub("0", text)
+    return _TOKEN_RE.findall(text)
+
+
+def _shingles(tokens: List[str], size: int = 3) -> Iterable[str]:
+    if len(tokens) < size:
+        return tokens
+    return (" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1))
+
+
+def _hash64(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str) -> int:
+    """Returns the SimHash of `text` as a signed 64-bit int (fits an SQLite INTEGER)."""
+    weights = [0] * SIMHASH_BITS
+    for feature in _shingles(_tokens(text)):
+        h = _hash64(feature)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    value = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            value |= 1 << bit
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin((a ^ b) & _MASK).count("1")
+
+
+def email_fingerprint(subject: str, body: str) -> int:
+    return simhash(f"{subject or ''}\n{body or ''}")
+
+
+def number_digest(subject: str, body: str) -> str:
+    """Digest of the numbers the fingerprint masks (amounts, dates, times), in order.
+
+    Near-duplicates only share a summary when these match, since the summary
+    repeats them.
+    """
+    text = _URL_RE.sub(" ", f"{subject or ''}\n{body or ''}")
+    numbers = " ".join(_NUMBER_RE.findall(text))
+    return hashlib.blake2b(numbers.encode("utf-8"), digest_size=8).hexdigest()
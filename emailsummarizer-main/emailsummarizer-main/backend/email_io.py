@@ -0,0 +1,111 @@
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Optional
+
+# NDJSON (one JSON email per line) import/export. Records use the same
+# field names as the /emails API, so an export can be imported unchanged.
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "500"))
+MAX_IMPORT_LINE_BYTES = 10 * 1024 * 1024
+
+IMPORT_FIELDS = {
+    "id", "sender", "subject", "body", "timestamp", "read", "category",
+    "action_items", "summary", "processed", "headers", "thread_id", "category_source", "source", "model_info",
+}
+EXPORT_FIELDS = [
+    "id", "sender", "subject", "body", "timestamp", "read", "category",
+    "action_items", "summary", "processed", "headers", "thread_id", "category_source", "source", "model_info",
+]
+
+# Expected type of each imported field other than id/timestamp. SQLAlchemy
+# only checks types at commit, where one bad record would fail its whole chunk.
+TEXT_FIELDS = {"sender", "subject", "body", "category", "summary", "thread_id", "category_source", "source"}
+BOOL_FIELDS = {"read", "processed"}
+OBJECT_FIELDS = {"headers", "model_info"}
+_BOOL_STRINGS = {"true": True, "false": False, "1": True, "0": False}
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """ISO-8601 string -> naive UTC datetime, matching how timestamps are stored."""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def record_to_email_data(record: Dict) -> Dict:
+    """Validates one imported record and keeps only known Email columns."""
+    if not isinstance(record, dict):
+        raise ValueError("record is not a JSON object")
+    if not record.get("id"):
+        raise ValueError("record has no id")
+    data = {key: value for key, value in record.items() if key in IMPORT_FIELDS}
+    data["id"] = str(data["id"])
+    for key, value in data.items():
+        if value is None:
+            continue
+        if key in TEXT_FIELDS and not isinstance(value, str):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"{key} must be a string")
+            data[key] = str(value)
+        elif key in BOOL_FIELDS and not isinstance(value, bool):
+            if str(value).lower() not in _BOOL_STRINGS:
+                raise ValueError(f"{key} must be true or false")
+            data[key] = _BOOL_STRINGS[str(value).lower()]
+        elif key in OBJECT_FIELDS and not isinstance(value, dict):
+            raise ValueError(f"{key} must be an object")
+        elif key == "action_items" and not isinstance(value, (list, dict, str)):
+            raise ValueError("action_items must be a list")
+    try:
+        data["timestamp"] = parse_timestamp(data.get("timestamp")) or datetime.utcnow()
+    except ValueError:
+        print(f"Warning: Could not parse timestamp {record.get('timestamp')}. Using current time.")
+        data["timestamp"] = datetime.utcnow()
+    return data
+
+
+def is_triaged(record: Dict) -> bool:
+    """True when a record already carries the results process_email_background would produce."""
+    return bool(record.get("processed") and record.get("category") and record.get("summary"))
+
+
+def email_to_record(email) -> Dict:
+    record = {field: getattr(email, field) for field in EXPORT_FIELDS}
+    record["timestamp"] = email.timestamp.isoformat() if email.timestamp else None
+    return record
+
+
+def to_ndjson_line(record: Dict) -> str:
+    return json.dumps(record, ensure_ascii=False, default=str) + "\n"
+
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Splits a byte stream into lines, holding at most one chunk plus a partial line."""
+    buffer = b""
+    async for chunk in chunks:
+        lines = (buffer + chunk).split(b"\n")
+        buffer = lines.pop() # Incomplete last line waits for the next chunk
+        for line in lines:
+            if line.strip():
+                yield line
+        if len(buffer) > MAX_IMPORT_LINE_BYTES:
+            raise ValueError(f"NDJSON line longer than {MAX_IMPORT_LINE_BYTES} bytes")
+    if buffer.strip():
+        yield buffer
+
+
+async def iter_file_chunks(path: str, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    # Mock fixtures are small local files; plain reads are fine here
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+# Per-client buffer size. Slow clients drop their oldest events instead of
+# growing memory without bound.
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "100"))
+EVENT_KEEPALIVE_SECONDS = float(os.getenv("EVENT_KEEPALIVE_SECONDS", "15"))
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Formats an event as a server-sent events message."""
+    return f"event: {event}\ndata: {json.dumps(data, default=_json_default)}\n\n"
+
+
+class EventBroadcaster:
+    """In-process pub/sub that fans events out to connected SSE clients."""
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self) -> asyncio.Queue:
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.buffer_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event: str, data: Dict[str, Any]):
+        if not self._subscribers or self._loop is None:
+            return
+        message = format_sse(event, data)
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._deliver(message)
+        else:
+            # Called from a worker thread; hand the message over to the loop.
+            self._loop.call_soon_threadsafe(self._deliver, message)
+
+    def _deliver(self, message: str):
+        self.published += 1
+        for queue in list(self._subscribers):
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(message)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+broadcaster = EventBroadcaster()
@@ -0,0 +1,226 @@
+import base64
+import codecs
+import email
+import os
+import re
+from datetime import datetime, timezone
+from email import policy
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+# Bodies are capped before they are stored so oversized newsletters don't
+# inflate every LLM prompt built from them.
+GMAIL_MAX_BODY_CHARS = int(os.getenv("GMAIL_MAX_BODY_CHARS", "20000"))
+# "full" (parsed payload), "raw" (RFC 822 source) or "metadata" (headers + snippet only)
+GMAIL_FETCH_FORMAT = os.getenv("GMAIL_FETCH_FORMAT", "full")
+FETCH_FORMATS = ("full", "raw", "metadata")
+
+# Headers kept on the Email row; the rest are dropped after parsing.
+KEPT_HEADERS = [
+    "List-Unsubscribe", "List-Id", "Precedence", "Auto-Submitted",
+    "In-Reply-To", "References", "Reply-To",
+]
+METADATA_HEADERS = ["From", "Subject", "Date"] + KEPT_HEADERS
+
+_BLOCK_TAGS = {"p", "div", "br", "tr", "li", "h1", "h2", "h3", "h4", "h5", "h6", "table", "blockquote", "hr"}
+_SKIP_TAGS = {"script", "style", "head", "title"}
+
+_REPLY_HEADER_RE = re.compile(r"^on\b.{0,200}\bwrote:\s*$", re.I | re.S)
+_ORIGINAL_MESSAGE_RE = re.compile(r"^(-{2,}\s*original message\s*-{2,}|_{10,})\s*$", re.I)
+# A forward's content is what the message is about, so it's kept as-is
+_FORWARDED_MESSAGE_RE = re.compile(r"^-{2,}\s*forwarded message\s*-{2,}\s*$", re.I)
+# RFC 3676 signature delimiter: exactly "-- " on its own line. A bare "--"
+# is often a section divider in plain-text mail, so it doesn't count.
+SIGNATURE_DELIMITER = "-- "
+# Signatures are only looked for this close to the end of the message
+SIGNATURE_MAX_LINES = 10
+_MOBILE_SIGNATURE_RE = re.compile(
+    r"^(sent from my \w+.*|get outlook for \w+.*|sent from (mail|yahoo mail|outlook) for \w+.*)\s*$", re.I
+)
+
+
+class _HTMLToText(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> str:
+    parser = _HTMLToText()
+    parser.feed(html)
+    parser.close()
+    text = "".join(parser.parts)
+    lines = [re.sub(r"[ \t\r\f\v\xa0]+", " ", line).strip() for line in text.split("\n")]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def strip_quoted_reply(text: str) -> str:
+    """Drops quoted reply history ("On ... wrote:", "> " lines); forwarded messages are kept."""
+    lines = text.splitlines()
+    kept = []
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if _FORWARDED_MESSAGE_RE.match(stripped):
+            kept.extend(lines[i:])
+            break
+        # "On <date>, <name> wrote:" is often wrapped over two lines
+        joined = f"{stripped} {lines[i + 1].strip()}" if i + 1 < len(lines) else stripped
+        if _ORIGINAL_MESSAGE_RE.match(stripped) or _REPLY_HEADER_RE.match(stripped) or \
+                (stripped.lower().startswith("on ") and _REPLY_HEADER_RE.match(joined)):
+            break
+        # Outlook-style quoted header block
+        if stripped.startswith("From:") and any(l.strip().startswith("Sent:") for l in lines[i + 1:i + 4]):
+            break
+        if stripped.startswith(">"):
+            continue
+        kept.append(line)
+    return "\n".join(kept).strip()
+
+
+def strip_signature(text: str) -> str:
+    lines = text.splitlines()
+    for i in range(max(0, len(lines) - SIGNATURE_MAX_LINES), len(lines)):
+        line = lines[i]
+        if (i > 0 and line == SIGNATURE_DELIMITER) or _MOBILE_SIGNATURE_RE.match(line.strip()):
+            return "\n".join(lines[:i]).strip()
+    return text
+
+
+def clean_body(text: str, max_chars: int = GMAIL_MAX_BODY_CHARS) -> str:
+    cleaned = strip_signature(strip_quoted_reply(text))
+    # Never strip a message down to nothing (e.g. a reply that is all quote)
+    if not cleaned:
+        cleaned = text.strip()
+    if len(cleaned) > max_chars:
+        cleaned = cleaned[:max_chars].rstrip() + "\n[...truncated]"
+    return cleaned
+
+
+def _decode_data(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _charset(part: Dict) -> str:
+    for header in part.get("headers", []):
+        if header["name"].lower() == "content-type":
+            match = re.search(r'charset="?([\w.:-]+)"?', header["value"], re.I)
+            if match:
+                return match.group(1)
+    return "utf-8"
+
+
+def _decode_text(raw: bytes, charset: str) -> str:
+    try:
+        codecs.lookup(charset)
+    except LookupError:
+        charset = "utf-8"
+    return raw.decode(charset, errors="replace")
+
+
+def _is_attachment(part: Dict) -> bool:
+    if part.get("filename"):
+        return True
+    return any(
+        h["name"].lower() == "content-disposition" and h["value"].lower().startswith("attachment")
+        for h in part.get("headers", [])
+    )
+
+
+def _walk_parts(part: Dict, found: Dict[str, str]):
+    """Collects the first text/plain and text/html bodies from a nested payload."""
+    mime_type = part.get("mimeType", "")
+    if mime_type.startswith("multipart/"):
+        for child in part.get("parts", []):
+            _walk_parts(child, found)
+        return
+    if mime_type not in ("text/plain", "text/html") or mime_type in found or _is_attachment(part):
+        return
+    # Large bodies come back as attachmentId only; those fall through to the snippet
+    data = part.get("body", {}).get("data")
+    if data:
+        found[mime_type] = _decode_text(_decode_data(data), _charset(part))
+
+
+def _extract_payload_body(payload: Dict) -> str:
+    found: Dict[str, str] = {}
+    _walk_parts(payload, found)
+    if found.get("text/plain", "").strip():
+        return found["text/plain"]
+    if found.get("text/html"):
+        return html_to_text(found["text/html"])
+    return ""
+
+
+def _extract_raw_body(message: email.message.EmailMessage) -> str:
+    part = message.get_body(preferencelist=("plain", "html"))
+    if part is None:
+        return ""
+    try:
+        content = part.get_content()
+    except (LookupError, UnicodeDecodeError):
+        content = _decode_text(part.get_payload(decode=True) or b"", "utf-8")
+    if part.get_content_type() == "text/html":
+        return html_to_text(content)
+    return content
+
+
+def _message_timestamp(msg: Dict, date_header: Optional[str]) -> datetime:
+    internal_date = msg.get("internalDate")
+    if internal_date:
+        return datetime.fromtimestamp(int(internal_date) / 1000, tz=timezone.utc).replace(tzinfo=None)
+    if date_header:
+        try:
+            parsed = parsedate_to_datetime(date_header)
+            if parsed.tzinfo:
+                parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+            return parsed
+        except (TypeError, ValueError):
+            pass
+    return datetime.utcnow()
+
+
+def parse_gmail_message(msg: Dict) -> Dict:
+    """Turns a users.messages.get response (any of FETCH_FORMATS) into Email column values."""
+    if "raw" in msg:
+        message = email.message_from_bytes(_decode_data(msg["raw"]), policy=policy.default)
+        headers = {name: str(value) for name, value in message.items()}
+        body = _extract_raw_body(message)
+    else:
+        payload = msg.get("payload", {})
+        headers = {h["name"]: h["value"] for h in payload.get("headers", [])}
+        body = _extract_payload_body(payload)
+
+    if not body.strip():
+        body = msg.get("snippet", "")
+
+    # Header names are case-insensitive
+    by_lower = {name.lower(): value for name, value in headers.items()}
+    return {
+        "id": msg["id"],
+        "thread_id": msg.get("threadId"),
+        "source": "gmail",
+        "sender": by_lower.get("from", "Unknown Sender"),
+        "subject": by_lower.get("subject", "No Subject"),
+        "body": clean_body(body),
+        "timestamp": _message_timestamp(msg, by_lower.get("date")),
+        "read": 'UNREAD' not in msg.get('labelIds', []),
+        "headers": {name: by_lower[name.lower()] for name in KEPT_HEADERS if name.lower() in by_lower},
+    }
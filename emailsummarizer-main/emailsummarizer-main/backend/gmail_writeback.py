@@ -0,0 +1,215 @@
+import asyncio
+import os
+from collections import defaultdict
+from typing import Dict, FrozenSet, List, Tuple
+
+from classifier import CATEGORIES, normalize_category
+
+# Opt-in: mirror the local `read` flag and the agent's category back to Gmail.
+# Changes from Store.update_email are accumulated per message and flushed with
+# users.messages.batchModify: one call per distinct (add, remove) label set and
+# up to 1000 ids, instead of one messages.modify per email.
+
+GMAIL_WRITEBACK_ENABLED = os.getenv("GMAIL_WRITEBACK", "false").lower() in ("1", "true", "yes")
+GMAIL_WRITEBACK_INTERVAL_SECONDS = float(os.getenv("GMAIL_WRITEBACK_INTERVAL_SECONDS", "30"))
+# Flush early once this many messages have pending changes
+GMAIL_WRITEBACK_THRESHOLD = int(os.getenv("GMAIL_WRITEBACK_THRESHOLD", "200"))
+GMAIL_BATCH_MODIFY_LIMIT = 1000 # Gmail API maximum ids per batchModify
+# A message whose change fails this many flushes (deleted in Gmail, say) is dropped
+GMAIL_WRITEBACK_MAX_ATTEMPTS = int(os.getenv("GMAIL_WRITEBACK_MAX_ATTEMPTS", "3"))
+# Cap on the extra calls spent splitting failed batches to find the bad ids, per flush
+GMAIL_WRITEBACK_MAX_SPLIT_CALLS = 50
+AGENT_LABEL_PREFIX = "Agent/"
+UNREAD_LABEL = "UNREAD"
+
+
+def agent_label_name(category: str) -> str:
+    return f"{AGENT_LABEL_PREFIX}{category}"
+
+
+class GmailWriteBack:
+    def __init__(self, enabled: bool = GMAIL_WRITEBACK_ENABLED):
+        self.enabled = enabled
+        self.pending: Dict[str, Dict] = {} # message id -> latest {"read", "category"}
+        self.label_ids: Dict[str, str] = {} # label name -> Gmail label id
+        self._labels_listed = False
+        self.attempts: Dict[str, int] = {} # message id -> failed flushes so far
+        self._service = None
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self.batch_calls = 0
+        self.messages_synced = 0
+        self.labels_created = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def record(self, email, updates: Dict) -> bool:
+        """Queues the Gmail-visible part of an update; later changes to the same message win."""
+        if not self.enabled or getattr(email, "source", None) != "gmail":
+            return False
+        change = {}
+        if "read" in updates and updates["read"] is not None:
+            change["read"] = bool(updates["read"])
+        category = normalize_category(updates.get("category"))
+        if category:
+            change["category"] = category
+        if not change:
+            return False
+        self.pending.setdefault(email.id, {}).update(change)
+        if len(self.pending) >= GMAIL_WRITEBACK_THRESHOLD:
+            self._wake.set()
+        return True
+
+    @staticmethod
+    def plan(pending: Dict[str, Dict]) -> Dict[Tuple[FrozenSet[str], FrozenSet[str]], List[str]]:
+        """Groups messages by the (add, remove) label names they need."""
+        groups: Dict[Tuple[FrozenSet[str], FrozenSet[str]], List[str]] = defaultdict(list)
+        for message_id, change in pending.items():
+            add, remove = set(), set()
+            if "read" in change:
+                (remove if change["read"] else add).add(UNREAD_LABEL)
+            if "category" in change:
+                add.add(agent_label_name(change["category"]))
+                remove.update(agent_label_name(c) for c in CATEGORIES if c != change["category"])
+            groups[(frozenset(add), frozenset(remove))].append(message_id)
+        return groups
+
+    def _resolve_label_ids(self, service, add_names, remove_names) -> Dict[str, str]:
+        """Maps label names to ids: system labels as-is, Agent/* labels from a cached labels.list.
+
+        Agent/* labels are created only when something is added to them; a
+        label that would only be removed and doesn't exist is simply left out.
+        """
+        add_agent = {name for name in add_names if name.startswith(AGENT_LABEL_PREFIX)}
+        remove_agent = {name for name in remove_names if name.startswith(AGENT_LABEL_PREFIX)}
+        if add_agent - self.label_ids.keys() or (remove_agent - self.label_ids.keys() and not self._labels_listed):
+            for label in service.users().labels().list(userId='me').execute().get("labels", []):
+                self.label_ids[label["name"]] = label["id"]
+            self._labels_listed = True
+        for name in add_agent - self.label_ids.keys():
+            label = service.users().labels().create(userId='me', body={
+                "name": name, "labelListVisibility": "labelShow", "messageListVisibility": "show",
+            }).execute()
+            self.label_ids[name] = label["id"]
+            self.labels_created += 1
+        resolved = {name: name for name in (set(add_names) | set(remove_names)) - add_agent - remove_agent}
+        resolved.update({name: self.label_ids[name] for name in add_agent | remove_agent if name in self.label_ids})
+        return resolved
+
+    def _clear_label_cache(self):
+        # A cached Agent/* label may have been deleted in Gmail
+        self.label_ids.clear()
+        self._labels_listed = False
+
+    def _batch_modify(self, message_ids: List[str], add: List[str], remove: List[str]):
+        self._service.users().messages().batchModify(userId='me', body={
+            "ids": message_ids, "addLabelIds": add, "removeLabelIds": remove,
+        }).execute()
+        self.batch_calls += 1
+
+    def _modify_isolating_failures(self, message_ids: List[str], add: List[str], remove: List[str], budget: List[int]) -> List[str]:
+        """batchModify; if Gmail rejects the batch, bisects it to find the bad ids. Returns the failed ids."""
+        if budget[0] <= 0:
+            return message_ids
+        budget[0] -= 1
+        try:
+            self._batch_modify(message_ids, add, remove)
+            self.messages_synced += len(message_ids)
+            return []
+        except Exception as e:
+            if len(message_ids) == 1:
+                print(f"Gmail write-back for message {message_ids[0]} failed: {e}")
+                return message_ids
+            middle = len(message_ids) // 2
+            return (self._modify_isolating_failures(message_ids[:middle], add, remove, budget)
+                    + self._modify_isolating_failures(message_ids[middle:], add, remove, budget))
+
+    def _apply(self, pending: Dict[str, Dict]) -> List[str]:
+        """Sends pending changes; returns the message ids that could not be written back."""
+        # Blocking Google client calls; run in a worker thread
+        if self._service is None:
+            from auth import get_gmail_service
+            self._service = get_gmail_service()
+        groups = self.plan(pending)
+        add_names = {name for add, _ in groups for name in add}
+        remove_names = {name for _, remove in groups for name in remove}
+        label_ids = self._resolve_label_ids(self._service, add_names, remove_names)
+        failed: List[str] = []
+        split_budget = [GMAIL_WRITEBACK_MAX_SPLIT_CALLS]
+        for (add, remove), message_ids in groups.items():
+            for start in range(0, len(message_ids), GMAIL_BATCH_MODIFY_LIMIT):
+                batch = message_ids[start:start + GMAIL_BATCH_MODIFY_LIMIT]
+                try:
+                    self._batch_modify(
+                        batch, [label_ids[n] for n in add], [label_ids[n] for n in remove if n in label_ids]
+                    )
+                    self.messages_synced += len(batch)
+                    continue
+                except Exception as e:
+                    print(f"Gmail batchModify of {len(batch)} messages failed, retrying with fresh labels: {e}")
+                # Stale label ids fail every message; refresh them before blaming individual ids
+                self._clear_label_cache()
+                label_ids = self._resolve_label_ids(self._service, add_names, remove_names)
+                failed += self._modify_isolating_failures(
+                    batch, [label_ids[n] for n in add], [label_ids[n] for n in remove if n in label_ids], split_budget,
+                )
+        return failed
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            pending, self.pending = self.pending, {}
+            self._wake.clear()
+            if not pending:
+                return 0
+            try:
+                failed = await asyncio.to_thread(self._apply, pending)
+            except asyncio.CancelledError:
+                # Shutdown cancelled the worker mid-flush: put the batch back so the
+                # final flush sends it (re-applying label changes is harmless)
+                for message_id, change in pending.items():
+                    self.pending[message_id] = {**change, **self.pending.get(message_id, {})}
+                raise
+            except Exception as e:
+                print(f"Gmail write-back of {len(pending)} messages failed: {e}")
+                self._clear_label_cache()
+                failed = list(pending)
+            for message_id in pending.keys() - set(failed):
+                self.attempts.pop(message_id, None)
+            if failed:
+                self.failures += 1
+            for message_id in failed:
+                attempts = self.attempts.get(message_id, 0) + 1
+                if attempts >= GMAIL_WRITEBACK_MAX_ATTEMPTS:
+                    # Give up on this message (e.g. deleted in Gmail) so it can't block later flushes
+                    self.attempts.pop(message_id, None)
+                    self.dropped += 1
+                    continue
+                self.attempts[message_id] = attempts
+                # Retry next flush, without overwriting changes recorded in the meantime
+                self.pending[message_id] = {**pending[message_id], **self.pending.get(message_id, {})}
+            return len(pending) - len(failed)
+
+    async def run(self):
+        """Worker loop: flush every GMAIL_WRITEBACK_INTERVAL_SECONDS, or sooner past the threshold."""
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=GMAIL_WRITEBACK_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "pending": len(self.pending),
+            "batch_calls": self.batch_calls,
+            "messages_synced": self.messages_synced,
+            "labels_cached": len(self.label_ids),
+            "labels_created": self.labels_created,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "retrying": len(self.attempts),
+        }
+
+
+gmail_writeback = GmailWriteBack()
@@ -1,18 +1,30 @@
 import os
-import google.generativeai as genai
+from typing import List
+
 from dotenv import load_dotenv
 
 load_dotenv()
 
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    print("Error: GEMINI_API_KEY not found in environment.")
-else:
-    genai.configure(api_key=api_key)
-    print("Listing available models:")
-    try:
-        for m in genai.list_models():
-            if 'generateContent' in m.supported_generation_methods:
-                print(m.name)
-    except Exception as e:
-        print(f"Error listing models: {e}")
+
+def discover_models(api_key: str = None) -> List[str]:
+    """Names of the models this key can call generateContent on, e.g. "gemini-2.0-flash"."""
+    import google.generativeai as genai
+    genai.configure(api_key=api_key or os.getenv("GEMINI_API_KEY"))
+    return [
+        m.name.split("/", 1)[-1] # "models/gemini-2.0-flash" -> "gemini-2.0-flash"
+        for m in genai.list_models()
+        if 'generateContent' in m.supported_generation_methods
+    ]
+
+
+if __name__ == "__main__":
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        print("Error: GEMINI_API_KEY not found in environment.")
+    else:
+        print("Listing available models:")
+        try:
+            for name in discover_models(api_key):
+                print(name)
+        except Exception as e:
+            print(f"Error listing models: {e}")
@@ -1,50 +1,118 @@
 import os
 import json
-import google.generativeai as genai
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
 
 from dotenv import load_dotenv
+from model_router import ModelRouter, LLM_DISCOVER_MODELS
+from singleflight import SingleFlight
 
 load_dotenv()
 
 # Get API key from environment variable
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+MOCK_MODEL = "mock" # Recorded when every model failed and a canned response was returned
 
-# Configure the model if the key is present
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-2.0-flash-lite')
-else:
-    model = None
+if not GEMINI_API_KEY:
     print("WARNING: No GEMINI_API_KEY found. LLM features will be disabled/mocked.")
 
+# Call type -> serving model, for whoever opened record_models() in this context
+_served_models: ContextVar[Optional[Dict[str, str]]] = ContextVar("served_models", default=None)
+
 class LLMService:
     def __init__(self):
-        self.model = model
+        self._models = {}
+        self._genai = None
+        self._discovery_done = False
+        self.router = ModelRouter()
+        # Identical prompts already in flight share one model call
+        self.prompt_flight = SingleFlight()
+        self.in_flight = 0 # Calls currently waiting on the model; 0 means idle capacity
+
+    def _get_model(self, name: str):
+        # google.generativeai takes most of a second to import, so it is
+        # loaded and configured on the first LLM call rather than at startup.
+        if not GEMINI_API_KEY:
+            raise RuntimeError("GEMINI_API_KEY is not set")
+        if self._genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            self._genai = genai
+        if name not in self._models:
+            self._models[name] = self._genai.GenerativeModel(name)
+        return self._models[name]
 
-    async def generate_text(self, prompt: str) -> str:
+    async def _discover_models(self):
+        # One list_models call on first use, so routes only name models this key can call
+        self._discovery_done = True
+        if not (GEMINI_API_KEY and LLM_DISCOVER_MODELS):
+            return
+        from list_models import discover_models
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            self.router.seed_from_discovery(await asyncio.to_thread(discover_models, GEMINI_API_KEY))
+        except Exception as e:
+            print(f"Model discovery failed, using configured routes as-is: {e}")
+
+    async def _call_model(self, name: str, prompt: str) -> str:
+        # Async call so a long generation doesn't block the event loop
+        response = await self._get_model(name).generate_content_async(prompt)
+        return response.text
+
+    @contextmanager
+    def record_models(self):
+        """Collects {call type: serving model} for LLM calls made inside the block."""
+        served: Dict[str, str] = {}
+        token = _served_models.set(served)
+        try:
+            yield served
+        finally:
+            _served_models.reset(token)
+
+    def _record(self, call_type: str, model: str):
+        served = _served_models.get()
+        if served is not None:
+            served[call_type] = model
+
+    async def wait_until_idle(self, poll_seconds: float = 0.5):
+        while self.in_flight:
+            await asyncio.sleep(poll_seconds)
+
+    async def generate_text(self, prompt: str, call_type: str = "default") -> str:
+        text, model = await self.prompt_flight.do((call_type, prompt), lambda: self._generate(prompt, call_type))
+        self._record(call_type, model) # Per caller, so coalesced callers record the model too
+        return text
+
+    async def _generate(self, prompt: str, call_type: str):
+        """Returns (text, serving model)."""
+        self.in_flight += 1
+        try:
+            if not self._discovery_done:
+                await self._discover_models()
+            return await self.router.run(call_type, prompt, self._call_model)
         except Exception as e:
             # Fallback mock responses based on prompt type
             if 'Categorize' in prompt:
-                return "Important"
+                return "Important", MOCK_MODEL
             if 'Extract' in prompt:
-                return "[\"Review the email\"]"
+                return "[\"Review the email\"]", MOCK_MODEL
             if 'Draft' in prompt:
-                return "Draft reply content based on instructions."
+                return "Draft reply content based on instructions.", MOCK_MODEL
             if 'Context' in prompt:
-                return "This is a mock answer to your query."
+                return "This is a mock answer to your query.", MOCK_MODEL
             print(f"LLM Error: {e}")
-            return f"Error generating response: {e}"
+            return f"Error generating response: {e}", MOCK_MODEL
+        finally:
+            self.in_flight -= 1
 
     async def categorize_email(self, email_body: str, prompt_template: str) -> str:
         prompt = f"{prompt_template}\n\nEmail Body:\n{email_body}"
-        return await self.generate_text(prompt)
+        return await self.generate_text(prompt, "categorize")
 
     async def extract_action_items(self, email_body: str, prompt_template: str) -> list:
         prompt = f"{prompt_template}\n\nEmail Body:\n{email_body}"
-        response_text = await self.generate_text(prompt)
+        response_text = await self.generate_text(prompt, "action_items")
         try:
             # Attempt to parse JSON from the response
             # Clean up potential markdown code blocks
@@ -81,7 +149,7 @@ class LLMService:
             context_for_prompt += f"Email Action Items: {json.dumps(email_action_items)}\n"
 
         full_prompt = f"{prompt_template}\n\nUser Instructions: {instructions}\n\n{context_for_prompt}"
-        response_text = await self.generate_text(full_prompt)
+        response_text = await self.generate_text(full_prompt, "draft")
 
         try:
             cleaned_text = response_text.replace("```json", "").replace("```", "").strip()
@@ -117,10 +185,12 @@ class LLMService:
                 "metadata": {}
             }
 
-    async def chat(self, query: str, context: str, history: list = [], focus_mode: bool = False) -> str:
+    async def chat(self, query: str, context: str, history: list = [], focus_mode: bool = False, history_summary: str = None) -> str:
         history_str = ""
+        if history_summary:
+            history_str = f"Summary of Earlier Conversation:\n{history_summary}\n\n"
         if history:
-            history_str = "Conversation History:\n"
+            history_str += "Conversation History:\n"
             for msg in history:
                 role = "User" if msg.get("role") == "user" else "Agent"
                 history_str += f"{role}: {msg.get('content')}\n"
@@ -189,10 +259,41 @@ Keep your answers concise and helpful.
 """
 
         prompt = f"{system_instruction}\n\nContext:\n{context}\n\n{history_str}User Query: {query}\n\nAnswer:"
-        return await self.generate_text(prompt)
+        return await self.generate_text(prompt, "chat")
 
     async def summarize_email(self, email_body: str) -> str:
         prompt = f"Please provide a concise summary of the following email:\n\n{email_body}"
-        return await self.generate_text(prompt)
+        return await self.generate_text(prompt, "summarize")
+
+    async def summarize_history(self, summary: str, messages: list) -> str:
+        """Folds older chat turns into a running summary of the conversation."""
+        transcript = "\n".join(
+            f"{'User' if m.get('role') == 'user' else 'Agent'}: {m.get('content')}" for m in messages
+        )
+        prompt = (
+            "Summarize this conversation between a user and their email assistant so it can be continued later. "
+            "Keep which emails, people, dates and decisions were discussed; drop pleasantries.\n\n"
+            f"Summary so far:\n{summary or '(none)'}\n\n"
+            f"New turns:\n{transcript}\n\n"
+            "Updated summary:"
+        )
+        with self.record_models() as served:
+            summary = await self.generate_text(prompt, "summarize")
+        if served.get("summarize") == MOCK_MODEL:
+            # The text is an error message; folding turns into it would lose them
+            raise RuntimeError(f"No model could summarize the chat history: {summary}")
+        return summary
+
+    async def summarize_thread_update(self, thread_summary: str, new_message: str) -> str:
+        """Folds a new message into an existing thread summary instead of re-reading the whole thread."""
+        prompt = (
+            "Here is a summary of an email conversation so far:\n\n"
+            f"{thread_summary}\n\n"
+            "A new message has arrived in the conversation:\n\n"
+            f"{new_message}\n\n"
+            "Please provide a concise updated summary of the whole conversation, "
+            "highlighting what the new message adds or changes."
+        )
+        return await self.generate_text(prompt, "summarize")
 
 llm_service = LLMService()
@@ -1,19 +1,34 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import uvicorn
-import base64
-import re
+import asyncio
+import contextlib
 import json
-from datetime import datetime
+import weakref
+from datetime import datetime, timedelta, timezone
 import os # Added for load_mock_emails
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from store import Store
-from llm import llm_service
+from llm import llm_service, MOCK_MODEL
 from auth import get_gmail_service
-from database import get_db, create_db_tables, seed_initial_prompts, Email, Prompt, Draft # Import new database functions and models
+from gmail_parser import parse_gmail_message, GMAIL_FETCH_FORMAT, FETCH_FORMATS, METADATA_HEADERS
+from events import broadcaster, EVENT_KEEPALIVE_SECONDS
+from dedup import email_fingerprint, number_digest
+from classifier import classifier, BODY_FEATURE_CHARS
+from chat_sessions import chat_sessions
+from singleflight import SingleFlight
+from speculative import draft_precomputer, prompt_version, email_version, DEFAULT_DRAFT_INSTRUCTIONS
+from email_io import (
+    IMPORT_CHUNK_SIZE, EXPORT_CHUNK_SIZE, record_to_email_data, is_triaged,
+    email_to_record, to_ndjson_line, iter_ndjson_lines, iter_file_chunks,
+)
+from gmail_writeback import gmail_writeback
+from cold_storage import COLD_STORAGE_AFTER_DAYS, COLD_STORAGE_INTERVAL_SECONDS, COLD_STORAGE_BATCH_SIZE
+from database import engine, get_db, session_scope, initialize_database, Email, Prompt, Draft # Import new database functions and models
 
 app = FastAPI(title="Prompt-Driven Email Agent")
 
@@ -37,11 +52,72 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Long-running jobs started at startup; referenced here so they aren't garbage collected
+background_jobs = set()
+
+def start_background_job(coro):
+    task = asyncio.create_task(coro)
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+    return task
+
+async def train_local_classifier():
+    async with session_scope() as db:
+        async for sender, subject, body, headers, category in Store(db).stream_labelled_emails(BODY_FEATURE_CHARS):
+            classifier.learn(sender, subject, body, headers, category)
+    print(f"Local classifier trained on {classifier.trained_samples} labelled emails.")
+
+async def compact_cold_storage(older_than_days: int) -> Dict[str, int]:
+    """Archives bodies older than the cutoff, one batch (and transaction) at a time."""
+    # Timestamps are stored as naive UTC
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=older_than_days)
+    totals = {"archived": 0, "original_bytes": 0, "compressed_bytes": 0}
+    while True:
+        async with session_scope() as db:
+            batch = await Store(db).compact_cold_storage(cutoff, COLD_STORAGE_BATCH_SIZE)
+        for key in totals:
+            totals[key] += batch[key]
+        if batch["archived"] < COLD_STORAGE_BATCH_SIZE:
+            return totals
+
+async def run_cold_storage_compaction():
+    while True:
+        try:
+            totals = await compact_cold_storage(COLD_STORAGE_AFTER_DAYS)
+            if totals["archived"]:
+                print(f"Cold storage: archived {totals['archived']} bodies "
+                      f"({totals['original_bytes']} -> {totals['compressed_bytes']} bytes).")
+        except Exception as e:
+            print(f"Cold storage compaction failed: {e}")
+        await asyncio.sleep(COLD_STORAGE_INTERVAL_SECONDS)
+
 # Startup event for database connection and seeding
 @app.on_event("startup")
-def startup_db_client():
-    create_db_tables() # Create tables if they don't exist
-    seed_initial_prompts() # Seed initial prompts
+async def startup_db_client():
+    # Creates tables / seeds prompts only when the schema or default prompts changed
+    schema_changed = await initialize_database()
+    if schema_changed:
+        async with session_scope() as db:
+            backfilled = await Store(db).backfill_action_items()
+        if backfilled:
+            print(f"Indexed action items for {backfilled} existing emails.")
+    start_background_job(train_local_classifier())
+    if draft_precomputer.enabled:
+        start_background_job(draft_precomputer.run(precompute_draft, llm_service.wait_until_idle))
+    if COLD_STORAGE_AFTER_DAYS > 0:
+        start_background_job(run_cold_storage_compaction())
+    if gmail_writeback.enabled:
+        start_background_job(gmail_writeback.run())
+
+@app.on_event("shutdown")
+async def shutdown_db_client():
+    # Stop long-running jobs first so none of them still holds a connection
+    for task in list(background_jobs):
+        task.cancel()
+    await asyncio.gather(*background_jobs, return_exceptions=True)
+    if gmail_writeback.enabled:
+        await gmail_writeback.flush() # Don't lose read/label changes still waiting for the timer
+    await engine.dispose() # Close pooled aiosqlite connections so their threads exit
 
 # Models
 class PromptUpdate(BaseModel):
@@ -52,7 +128,11 @@ class PromptUpdate(BaseModel):
 class ChatRequest(BaseModel):
     query: str
     email_id: Optional[str] = None
-    history: Optional[List[Dict[str, str]]] = []
+    session_id: Optional[str] = None # Server-side history; omit to start a new session
+    history: Optional[List[Dict[str, str]]] = [] # Deprecated: only used to seed a new session
+
+class EmailUpdate(BaseModel):
+    read: Optional[bool] = None
 
 class DraftResponse(BaseModel):
     id: int
@@ -63,7 +143,7 @@ class DraftResponse(BaseModel):
 
 class DraftRequest(BaseModel):
     email_id: str
-    instructions: Optional[str] = "Reply to this email"
+    instructions: Optional[str] = DEFAULT_DRAFT_INSTRUCTIONS
 
 class DraftUpdate(BaseModel):
     subject: Optional[str] = None
@@ -71,117 +151,326 @@ class DraftUpdate(BaseModel):
     suggested_follow_ups: Optional[List[str]] = None
     draft_metadata: Optional[Dict[str, Any]] = None
 
-# Helper to parse Gmail message
-def parse_gmail_message(msg):
-    payload = msg.get('payload', {})
-    headers = payload.get('headers', [])
-    
-    subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-    sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown Sender')
-    
-    # Get Body
-    body = ''
-    if 'parts' in payload:
-        for part in payload['parts']:
-            if part['mimeType'] == 'text/plain':
-                body_data = part['body'].get('data')
-                if body_data:
-                    body = base64.urlsafe_b64decode(body_data).decode('utf-8')
-                    break
-    elif 'body' in payload and 'data' in payload['body']:
-        body_data = payload['body'].get('data')
-        if body_data:
-            body = base64.urlsafe_b64decode(body_data).decode('utf-8')
-    
-    if not body:
-        body = msg.get('snippet', '')
+# One lock per thread id, alive only while some message of that thread is being triaged
+_thread_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+# Out-of-order arrivals re-fold at most this many of the thread's newest messages
+THREAD_REBUILD_MAX_MESSAGES = int(os.getenv("THREAD_REBUILD_MAX_MESSAGES", "20"))
 
-    return {
-        "id": msg['id'],
-        "sender": sender,
-        "subject": subject,
-        "body": body,
-        "timestamp": datetime.now(), # Use datetime object for SQLAlchemy
-        "read": 'UNREAD' not in msg.get('labelIds', [])
-    }
+def thread_lock(thread_id: Optional[str]):
+    if not thread_id:
+        return contextlib.nullcontext()
+    lock = _thread_locks.get(thread_id)
+    if lock is None:
+        lock = _thread_locks[thread_id] = asyncio.Lock()
+    return lock
+
+def thread_order(email_data: Dict):
+    # Queue messages oldest-first within each thread so they fold in order
+    return (email_data.get("thread_id") or "", email_data.get("timestamp") or datetime.min)
+
+# Overlapping triggers (double-clicked reprocess, sync + load-mock) for the same
+# email join the run already in progress instead of repeating the LLM calls.
+processing_flight = SingleFlight()
 
 async def process_email_background(email_id: str):
-    db = next(get_db()) # Get a new session for background task
-    _store = Store(db)
-    email = _store.get_email(email_id)
-    if not email:
-        print(f"Email {email_id} not found for background processing. It might have been deleted.")
-        db.close()
-        return
+    await processing_flight.do(email_id, lambda: _process_email(email_id))
+
+async def _process_email(email_id: str):
+    # Sessions are held only around DB reads/writes, never across LLM calls,
+    # so slow Gemini responses don't pin a pooled connection.
+    async with session_scope() as db:
+        _store = Store(db)
+        email = await _store.get_email(email_id)
+        if not email:
+            print(f"Email {email_id} not found for background processing. It might have been deleted.")
+            return
+        email_body = email.body
+        email_sender, email_subject, email_headers = email.sender, email.subject, email.headers
+        email_timestamp = email.timestamp
+        thread_id = email.thread_id
+        prompts = await _store.get_prompts() # Get prompts from the database
+
+        fingerprint = email_fingerprint(email.subject, email.body)
+        numbers = number_digest(email.subject, email.body)
+        duplicate = await _store.find_near_duplicate(email, fingerprint)
 
-    prompts = _store.get_prompts() # Get prompts from the database
     categorization_prompt = prompts.get("categorization", "Default categorization prompt if not found.")
     action_item_prompt = prompts.get("action_item", "Default action item prompt if not found.")
 
-    try:
-        category = await llm_service.categorize_email(email.body, categorization_prompt)
-        raw_actions = await llm_service.extract_action_items(email.body, action_item_prompt)
-        summary = await llm_service.summarize_email(email.body)
-
-        action_items_parsed = []
-        if isinstance(raw_actions, list):
-            action_items_parsed = raw_actions
-        elif isinstance(raw_actions, str):
-            try:
-                action_items_parsed = json.loads(raw_actions)
-            except json.JSONDecodeError:
-                print(f"Warning: Could not parse action items for email {email_id}. Raw: {raw_actions}")
-                action_items_parsed = []
-        
-        updates = {
-            "category": category.strip(),
-            "action_items": action_items_parsed,
+    # Messages of one thread are triaged one at a time, so each folds into the
+    # summary the previous one saved rather than both reading the same base.
+    async with thread_lock(thread_id):
+        thread = None
+        if thread_id:
+            async with session_scope() as db:
+                thread = await Store(db).get_thread(thread_id)
+
+        # Fold this message into the running thread summary when it is the newest
+        # one we've seen; re-processing the latest message folds against the
+        # summary from before it was added.
+        is_latest = not thread or thread.last_email_id == email_id or not thread.last_timestamp \
+            or not email_timestamp or email_timestamp >= thread.last_timestamp
+        thread_base = None
+        if thread and is_latest:
+            thread_base = thread.prior_summary if thread.last_email_id == email_id else thread.summary
+
+        try:
+            with llm_service.record_models() as served_models:
+                # A duplicate's summary is only reusable when it describes that one
+                # email (not a rolled-up thread summary), quotes the same amounts
+                # and dates, and there is no running summary of our own thread to
+                # fold into.
+                reuse_summary = bool(duplicate) and duplicate.thread_id is None and not thread_base \
+                    and duplicate.number_digest == numbers
+                if duplicate:
+                    # Near-identical to an email we've already triaged; reuse its results
+                    category = duplicate.category
+                    category_source = "duplicate"
+                    print(f"Email {email_id} is a near-duplicate of {duplicate.id}; reusing its category"
+                          f"{' and summary' if reuse_summary else ''}.")
+                else:
+                    category = classifier.classify(email_sender, email_subject, email_body, email_headers)
+                    category_source = "local"
+                    if not category:
+                        category = await llm_service.categorize_email(email_body, categorization_prompt)
+                        if served_models.get("categorize") == MOCK_MODEL:
+                            # Every model failed and the canned answer came back; don't train on it
+                            category_source = "fallback"
+                        else:
+                            category_source = "llm"
+                            classifier.learn(email_sender, email_subject, email_body, email_headers, category)
+                if reuse_summary:
+                    summary = duplicate.summary
+                elif thread_base:
+                    summary = await llm_service.summarize_thread_update(thread_base, email_body)
+                else:
+                    summary = await llm_service.summarize_email(email_body)
+                raw_actions = await llm_service.extract_action_items(email_body, action_item_prompt)
+
+            action_items_parsed = []
+            if isinstance(raw_actions, list):
+                action_items_parsed = raw_actions
+            elif isinstance(raw_actions, str):
+                try:
+                    action_items_parsed = json.loads(raw_actions)
+                except json.JSONDecodeError:
+                    print(f"Warning: Could not parse action items for email {email_id}. Raw: {raw_actions}")
+                    action_items_parsed = []
+            
+            updates = {
+                "category": category.strip(),
+                "action_items": action_items_parsed,
+                "summary": summary,
+                "processed": True,
+                "simhash": fingerprint,
+                "number_digest": numbers,
+                "duplicate_of": duplicate.id if duplicate else None,
+                "category_source": category_source,
+                "model_info": served_models or None, # {call type: model}; empty when fully reused
+            }
+            
+            async with session_scope() as db:
+                _store = Store(db)
+                await _store.update_email(email_id, updates)
+                if draft_precomputer.enabled:
+                    # Any cached draft was based on the previous category/action items
+                    await _store.delete_precomputed_draft(email_id)
+                if thread_id and is_latest and served_models.get("summarize") == MOCK_MODEL:
+                    # The summary is an error string; keep the thread's last good summary
+                    print(f"Thread {thread_id} summary not updated: no model answered for email {email_id}.")
+                elif thread_id and is_latest:
+                    is_new_message = not thread or thread.last_email_id != email_id
+                    await _store.save_thread(thread_id, {
+                        "summary": summary,
+                        "prior_summary": thread_base,
+                        "last_email_id": email_id,
+                        "last_timestamp": email_timestamp,
+                        "message_count": (thread.message_count if thread else 0) + (1 if is_new_message else 0),
+                    })
+            if thread_id and not is_latest:
+                # An older message arrived after newer ones were folded in
+                await rebuild_thread_summary(thread_id)
+            print(f"Email {email_id} processed successfully. Category: {category.strip()}")
+            draft_precomputer.schedule(email_id, category)
+
+        except Exception as e:
+            print(f"Error processing email {email_id}: {e}")
+            async with session_scope() as db:
+                await Store(db).update_email(email_id, {"processed": False, "processing_error": str(e)})
+
+async def rebuild_thread_summary(thread_id: str):
+    """Re-folds the thread's processed messages oldest-first (the newest THREAD_REBUILD_MAX_MESSAGES)."""
+    async with session_scope() as db:
+        messages, total = await Store(db).get_thread_messages(thread_id, THREAD_REBUILD_MAX_MESSAGES)
+        messages = [(m.id, m.timestamp, m.body) for m in messages]
+    if not messages:
+        return
+    summary = prior_summary = None
+    for _, _, body in messages:
+        prior_summary = summary
+        with llm_service.record_models() as served_models:
+            if summary:
+                summary = await llm_service.summarize_thread_update(summary, body)
+            else:
+                summary = await llm_service.summarize_email(body)
+        if served_models.get("summarize") == MOCK_MODEL:
+            # An error string would become the running summary; keep the old one
+            print(f"Rebuild of thread {thread_id} abandoned: no model could summarize it.")
+            return
+    last_id, last_timestamp, _ = messages[-1]
+    async with session_scope() as db:
+        await Store(db).save_thread(thread_id, {
             "summary": summary,
-            "processed": True
-        }
-        
-        _store.update_email(email_id, updates)
-        print(f"Email {email_id} processed successfully. Category: {category.strip()}")
+            "prior_summary": prior_summary,
+            "last_email_id": last_id,
+            "last_timestamp": last_timestamp,
+            "message_count": total,
+        })
+    print(f"Rebuilt summary of thread {thread_id} from {len(messages)} messages.")
+
+# Bulk imports are triaged by a fixed pool of workers fed through a bounded
+# queue, so neither the pending ids nor the tasks grow with the import size.
+IMPORT_PROCESS_CONCURRENCY = int(os.getenv("IMPORT_PROCESS_CONCURRENCY", "4"))
+IMPORT_QUEUE_SIZE = int(os.getenv("IMPORT_QUEUE_SIZE", "1000"))
+
+async def triage_worker(queue: asyncio.Queue):
+    while True:
+        email_id = await queue.get()
+        try:
+            await process_email_background(email_id)
+        except Exception as e:
+            print(f"Triage of imported email {email_id} failed: {e}")
+        finally:
+            queue.task_done()
+
+async def stop_triage_workers(queue: asyncio.Queue, workers: List[asyncio.Task]):
+    await queue.join()
+    for worker in workers:
+        worker.cancel()
+
+async def import_ndjson(lines, skip_processed: bool) -> Dict[str, Any]:
+    """Inserts NDJSON email records in chunks of IMPORT_CHUNK_SIZE, one transaction per chunk.
+
+    Emails that need triage go to a worker pool started with the first such
+    chunk; once IMPORT_QUEUE_SIZE ids are waiting, the import slows to the
+    triage rate instead of buffering more.
+    """
+    result = {"received": 0, "inserted": 0, "existing": 0, "skipped_triage": 0, "queued": 0, "errors": []}
+    chunk: List[Dict] = []
+    queue: Optional[asyncio.Queue] = None
+    workers: List[asyncio.Task] = []
+
+    async def flush():
+        nonlocal queue
+        async with session_scope() as db:
+            inserted = set(await Store(db).add_emails(chunk))
+        result["inserted"] += len(inserted)
+        result["existing"] += len(chunk) - len(inserted)
+        for email_data in sorted(chunk, key=thread_order):
+            if email_data["id"] not in inserted:
+                continue
+            if skip_processed and is_triaged(email_data):
+                # Already triaged: keep its labels and let the local classifier learn from them
+                classifier.learn(email_data.get("sender"), email_data.get("subject"), email_data.get("body"),
+                                 email_data.get("headers"), email_data["category"])
+                result["skipped_triage"] += 1
+            else:
+                if queue is None:
+                    queue = asyncio.Queue(maxsize=IMPORT_QUEUE_SIZE)
+                    workers.extend(start_background_job(triage_worker(queue)) for _ in range(IMPORT_PROCESS_CONCURRENCY))
+                await queue.put(email_data["id"])
+                result["queued"] += 1
+        chunk.clear()
 
-    except Exception as e:
-        print(f"Error processing email {email_id}: {e}")
-        _store.update_email(email_id, {"processed": False, "processing_error": str(e)})
+    try:
+        line_number = 0
+        async for line in lines:
+            line_number += 1
+            try:
+                email_data = record_to_email_data(json.loads(line))
+            except ValueError as e: # json.JSONDecodeError is a ValueError
+                if len(result["errors"]) < 100:
+                    result["errors"].append({"line": line_number, "error": str(e)})
+                continue
+            result["received"] += 1
+            if skip_processed and is_triaged(email_data):
+                email_data["simhash"] = email_fingerprint(email_data.get("subject"), email_data.get("body"))
+                email_data["number_digest"] = number_digest(email_data.get("subject"), email_data.get("body"))
+            else:
+                # Triage results are recomputed, so don't import half-finished state
+                email_data["processed"] = False
+            chunk.append(email_data)
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                await flush()
+        if chunk:
+            await flush()
     finally:
-        db.close()
+        if queue is not None:
+            # Workers exit once everything queued by this import has been triaged
+            start_background_job(stop_triage_workers(queue, workers))
+    return result
 
 # Endpoints
 
+@app.get("/events")
+async def stream_events(request: Request):
+    """Server-sent events stream of email.processed, email.failed and draft.created deltas."""
+    queue = broadcaster.subscribe()
+
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n" # Comment line keeps proxies from closing idle streams
+                    continue
+                yield message
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
+
 @app.get("/emails")
-async def get_emails(db: Session = Depends(get_db)):
+async def get_emails(db: AsyncSession = Depends(get_db)):
     _store = Store(db)
-    emails = _store.get_emails()
+    emails = await _store.get_emails()
     # Convert SQLAlchemy models to dicts for JSON serialization
+    # Archived emails are listed with body=null; GET /emails/{id} decompresses it
     return [{"id": e.id, "sender": e.sender, "subject": e.subject, "body": e.body, 
              "timestamp": e.timestamp.isoformat() if e.timestamp else None, 
              "read": e.read, "category": e.category, "action_items": e.action_items, 
-             "summary": e.summary, "processed": e.processed} for e in emails]
+             "summary": e.summary, "processed": e.processed, "archived": bool(e.archived)} for e in emails]
+
+def fetch_gmail_messages(fetch_format: str, max_results: int = 10) -> List[Dict]:
+    """Lists and fetches recent messages; blocking, so callers run it in a worker thread."""
+    service = get_gmail_service()
+    results = service.users().messages().list(userId='me', maxResults=max_results).execute()
+    messages = results.get('messages', [])
+    extra = {"metadataHeaders": METADATA_HEADERS} if fetch_format == "metadata" else {}
+    return [
+        service.users().messages().get(userId='me', id=message['id'], format=fetch_format, **extra).execute()
+        for message in messages
+    ]
 
 @app.get("/gmail/sync")
 async def sync_gmail(
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    fetch_format: str = Query(GMAIL_FETCH_FORMAT, alias="format"),
+    db: AsyncSession = Depends(get_db)
 ):
+    if fetch_format not in FETCH_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FETCH_FORMATS)}")
     try:
-        service = get_gmail_service()
-        results = service.users().messages().list(userId='me', maxResults=10).execute()
-        messages = results.get('messages', [])
-        
-        new_emails_data = []
-        _store = Store(db)
+        messages = await asyncio.to_thread(fetch_gmail_messages, fetch_format)
+        new_emails_data = [parse_gmail_message(msg) for msg in messages]
 
-        for message in messages:
-            msg = service.users().messages().get(userId='me', id=message['id']).execute()
-            parsed_email_data = parse_gmail_message(msg)
-            new_emails_data.append(parsed_email_data)
-        
-        _store.add_emails(new_emails_data)
+        _store = Store(db)
+        await _store.add_emails(new_emails_data)
 
-        for email_data in new_emails_data:
+        # Gmail lists newest first; background tasks run in order, so queue oldest first
+        for email_data in sorted(new_emails_data, key=thread_order):
             background_tasks.add_task(process_email_background, email_data["id"])
         
         return {"status": "success", "count": len(new_emails_data)}
@@ -190,90 +479,174 @@ async def sync_gmail(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/emails/load-mock")
-async def load_mock_emails(
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
-):
-    """Load mock emails from mock_data/inbox.json for testing without Gmail auth"""
+async def load_mock_emails(skip_processed: bool = False):
+    """Load mock emails from mock_data/inbox.ndjson for testing without Gmail auth"""
+    mock_file = os.path.join(os.path.dirname(__file__), "mock_data", "inbox.ndjson")
+    if not os.path.exists(mock_file):
+        raise HTTPException(status_code=404, detail="Mock data file not found")
     try:
-        mock_file = os.path.join(os.path.dirname(__file__), "mock_data", "inbox.json")
-        if not os.path.exists(mock_file):
-            raise HTTPException(status_code=404, detail="Mock data file not found")
-        
-        with open(mock_file, 'r', encoding='utf-8') as f:
-            mock_emails_data = json.load(f)
-        
-        _store = Store(db)
-        # Convert timestamp strings to datetime objects
-        for email_data in mock_emails_data:
-            if "timestamp" in email_data and isinstance(email_data["timestamp"], str):
-                try:
-                    email_data["timestamp"] = datetime.fromisoformat(email_data["timestamp"].replace('Z', '+00:00'))
-                except ValueError:
-                    print(f"Warning: Could not parse timestamp {email_data['timestamp']}. Using current time.")
-                    email_data["timestamp"] = datetime.now()
-        _store.add_emails(mock_emails_data)
-        
-        for email_data in mock_emails_data:
-            background_tasks.add_task(process_email_background, email_data["id"])
-        
-        return {"status": "success", "count": len(mock_emails_data)}
+        result = await import_ndjson(iter_ndjson_lines(iter_file_chunks(mock_file)), skip_processed)
+        return {"status": "success", "count": result["received"], **result}
     except Exception as e:
         print(f"Load Mock Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/emails/import")
+async def import_emails(request: Request, skip_processed: bool = False):
+    """Streams an NDJSON body (one email per line) into the database.
+
+    With skip_processed=true, records that already carry category, summary and
+    processed=true are stored as-is instead of being re-triaged by the LLM.
+    """
+    try:
+        result = await import_ndjson(iter_ndjson_lines(request.stream()), skip_processed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", **result}
+
+@app.get("/emails/export")
+async def export_emails():
+    """Streams every email as NDJSON, reading EXPORT_CHUNK_SIZE rows per query."""
+    async def export_stream():
+        after_id = None
+        while True:
+            # Short-lived session per page so a slow client doesn't pin a connection
+            async with session_scope() as db:
+                page = await Store(db).get_emails_page(after_id, EXPORT_CHUNK_SIZE)
+                lines = "".join(to_ndjson_line(email_to_record(email)) for email in page)
+            if not page:
+                return
+            yield lines
+            after_id = page[-1].id
+
+    headers = {"Content-Disposition": 'attachment; filename="emails.ndjson"'}
+    return StreamingResponse(export_stream(), media_type="application/x-ndjson", headers=headers)
+
 @app.get("/emails/{email_id}")
-async def get_email(email_id: str, db: Session = Depends(get_db)):
+async def get_email(email_id: str, db: AsyncSession = Depends(get_db)):
     _store = Store(db)
-    email = _store.get_email(email_id)
+    email = await _store.get_email(email_id)
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
     # Convert SQLAlchemy model to dict for JSON serialization
     return {"id": email.id, "sender": email.sender, "subject": email.subject, "body": email.body, 
             "timestamp": email.timestamp.isoformat() if email.timestamp else None, 
             "read": email.read, "category": email.category, "action_items": email.action_items, 
-            "summary": email.summary, "processed": email.processed}
+            "summary": email.summary, "processed": email.processed, "model_info": email.model_info}
+
+@app.patch("/emails/{email_id}")
+async def update_email(email_id: str, email_update: EmailUpdate, db: AsyncSession = Depends(get_db)):
+    """Updates user-editable fields (currently the read flag); synced back to Gmail when enabled."""
+    updates = email_update.dict(exclude_unset=True)
+    _store = Store(db)
+    email = await _store.update_email(email_id, updates) if updates else await _store.get_email(email_id)
+    if not email:
+        raise HTTPException(status_code=404, detail="Email not found")
+    return {"id": email.id, "read": email.read}
 
 @app.post("/emails/{email_id}/process")
 async def process_email(
     email_id: str,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     _store = Store(db)
-    email = _store.get_email(email_id)
+    email = await _store.get_email(email_id)
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
     
     background_tasks.add_task(process_email_background, email_id)
     return {"status": "processing started", "email_id": email_id}
 
+@app.get("/action-items")
+async def get_action_items(
+    before: Optional[datetime] = None,
+    after: Optional[datetime] = None,
+    include_undated: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """Action items across the inbox, ordered by deadline, e.g. ?after=<monday>&before=<next monday>."""
+    _store = Store(db)
+    # Deadlines are stored as naive UTC
+    if before and before.tzinfo:
+        before = before.astimezone(timezone.utc).replace(tzinfo=None)
+    if after and after.tzinfo:
+        after = after.astimezone(timezone.utc).replace(tzinfo=None)
+    rows = await _store.get_action_items(before=before, after=after, include_undated=include_undated)
+    return [{"id": item.id, "email_id": item.email_id, "task": item.task,
+             "deadline": item.deadline.isoformat() if item.deadline else None,
+             "deadline_text": item.deadline_text, "subject": subject, "sender": sender}
+            for item, subject, sender in rows]
+
+@app.get("/stats")
+async def get_stats():
+    """Runtime counters, e.g. how many LLM calls the local classifier has saved."""
+    return {
+        "classifier": classifier.stats(),
+        "speculative_drafts": draft_precomputer.stats(),
+        "events": broadcaster.stats(),
+        "gmail_writeback": gmail_writeback.stats(),
+        "llm": llm_service.router.stats(),
+        "single_flight": {
+            "processing": processing_flight.stats(),
+            "llm_prompts": llm_service.prompt_flight.stats(),
+        },
+    }
+
+@app.get("/storage/stats")
+async def get_storage_stats(db: AsyncSession = Depends(get_db)):
+    """Sizes of the hot emails table and the compressed cold tier."""
+    stats = await Store(db).storage_stats()
+    stats["cold_after_days"] = COLD_STORAGE_AFTER_DAYS or None
+    return stats
+
+@app.post("/storage/compact")
+async def compact_storage(older_than_days: Optional[int] = Query(None, ge=0)):
+    """Runs cold-storage compaction now; defaults to COLD_STORAGE_AFTER_DAYS."""
+    days = older_than_days if older_than_days is not None else COLD_STORAGE_AFTER_DAYS
+    if not days and older_than_days is None:
+        raise HTTPException(status_code=400, detail="Pass older_than_days or set COLD_STORAGE_AFTER_DAYS")
+    return await compact_cold_storage(days)
+
 @app.get("/prompts", response_model=Dict[str, str]) # Specify response model
-async def get_prompts(db: Session = Depends(get_db)):
+async def get_prompts(db: AsyncSession = Depends(get_db)):
     _store = Store(db)
-    return _store.get_prompts()
+    return await _store.get_prompts()
 
 @app.post("/prompts")
-async def update_prompts(prompts: PromptUpdate, db: Session = Depends(get_db)):
+async def update_prompts(prompts: PromptUpdate, db: AsyncSession = Depends(get_db)):
     _store = Store(db)
     updates = prompts.dict(exclude_unset=True)
-    _store.update_prompts(updates)
-    return _store.get_prompts()
+    await _store.update_prompts(updates)
+    return await _store.get_prompts()
+
+async def compact_chat_session(session_id: str):
+    async with session_scope() as db:
+        _store = Store(db)
+        session = await chat_sessions.get_or_create(_store, session_id)
+        try:
+            await chat_sessions.compact(_store, session, llm_service.summarize_history)
+        except Exception as e:
+            # Turns stay unfolded; the next chat message retries
+            print(f"Chat session {session_id} compaction skipped: {e}")
 
 @app.post("/agent/chat", response_model=Dict[str, str]) # Specify response model
 async def agent_chat(
     request: ChatRequest,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
 ):
     _store = Store(db)
+    session = await chat_sessions.get_or_create(_store, request.session_id, seed_history=request.history)
     
     # 1. Build Global Context (Inbox Overview)
     # Fetch recent emails (e.g., last 20) to provide general context
-    all_emails = _store.get_emails()
+    all_emails = await _store.get_emails()
     # Sort by timestamp desc to ensure "latest" is actually latest
     all_emails.sort(key=lambda x: x.timestamp if x.timestamp else datetime.min, reverse=True)
     
     recent_emails = all_emails[:20] # Limit to 20 for context window
+    await _store.load_cold_bodies(recent_emails[:5]) # Full bodies are only shown for the top 5
     
     inbox_context_parts = ["📬 **INBOX OVERVIEW** (Most Recent First)\n"]
     for i, email in enumerate(recent_emails):
@@ -313,12 +686,20 @@ async def agent_chat(
             
             inbox_context_parts.append(email_summary)
     
+    # Deadlines come pre-parsed from the action_items table rather than
+    # leaving the LLM to dig them out of 20 email bodies.
+    deadline_rows = await _store.get_action_items(email_ids=[e.id for e in recent_emails])
+    if deadline_rows:
+        inbox_context_parts.append("\n📅 **KNOWN DEADLINES** (Soonest First)")
+        for item, subject, sender in deadline_rows:
+            inbox_context_parts.append(f"• {item.deadline:%Y-%m-%d %H:%M} | {item.task} | {subject} | From: {sender}")
+
     inbox_context = "\n".join(inbox_context_parts)
 
     # 2. Build Specific Context (if email_id provided)
     specific_context = ""
     if request.email_id:
-        email = _store.get_email(request.email_id)
+        email = await _store.get_email(request.email_id)
         if email:
             items_str = "None"
             if email.action_items:
@@ -340,43 +721,112 @@ async def agent_chat(
     # 3. Combine Context
     full_context = inbox_context + specific_context
     
+    # Release the pooled connection before the (slow) LLM call
+    await db.close()
+
     # 4. Call LLM
     # The LLM now has visibility into the inbox, specific email, and conversation history.
     # Enable focus_mode if a specific email_id is provided
     is_specific_email = bool(request.email_id)
-    response = await llm_service.chat(request.query, full_context, request.history, focus_mode=is_specific_email)
-    return {"response": response}
+    with llm_service.record_models() as served_models:
+        response = await llm_service.chat(
+            request.query, full_context, session.history,
+            focus_mode=is_specific_email, history_summary=session.summary
+        )
+
+    async with session_scope() as db:
+        await chat_sessions.append(Store(db), session, [
+            {"role": "user", "content": request.query},
+            {"role": "agent", "content": response},
+        ])
+    if chat_sessions.needs_compaction(session):
+        # Fold older turns after responding so this request doesn't wait on the summary
+        background_tasks.add_task(compact_chat_session, session.id)
+    return {"response": response, "session_id": session.id, "model": served_models.get("chat", "")}
+
+async def build_draft_data(email: Email, instructions: str, auto_reply_prompt: str) -> Dict[str, Any]:
+    # Pass email's processed data to generate_draft for better context
+    with llm_service.record_models() as served_models:
+        draft_output = await llm_service.generate_draft(
+            email_body=email.body,
+            instructions=instructions,
+            prompt_template=auto_reply_prompt,
+            email_category=email.category,
+            email_action_items=email.action_items
+        )
+    draft_metadata = draft_output.get("metadata") or {}
+    if not isinstance(draft_metadata, dict):
+        draft_metadata = {"value": draft_metadata}
+    draft_metadata["model"] = served_models.get("draft")
+    return {
+        "email_id": email.id,
+        "subject": f"Re: {email.subject}",
+        "body": draft_output.get("body", ""),
+        "suggested_follow_ups": draft_output.get("suggested_follow_ups", []),
+        "draft_metadata": draft_metadata  # Map to draft_metadata column
+    }
+
+async def precompute_draft(email_id: str):
+    """Speculatively drafts a default reply and caches it for the first /drafts request."""
+    async with session_scope() as db:
+        _store = Store(db)
+        email = await _store.get_email(email_id)
+        if not email:
+            return
+        prompts = await _store.get_prompts()
+    auto_reply_prompt = prompts.get("auto_reply", "Default auto-reply prompt if not found.")
+    version = email_version(email)
+
+    draft_data = await build_draft_data(email, DEFAULT_DRAFT_INSTRUCTIONS, auto_reply_prompt)
+    async with session_scope() as db:
+        _store = Store(db)
+        current = await _store.get_email(email_id)
+        if not current or email_version(current) != version:
+            # Re-processed while we were generating; this draft is already stale
+            print(f"Discarding precomputed draft for email {email_id}: email changed during generation.")
+            return
+        await _store.save_precomputed_draft({
+            **draft_data,
+            "prompt_version": prompt_version(auto_reply_prompt),
+            "email_version": version,
+            "instructions": DEFAULT_DRAFT_INSTRUCTIONS,
+        })
+    print(f"Precomputed draft for email {email_id}.")
 
 @app.post("/drafts", response_model=DraftResponse) # Add response_model for structured output
 async def generate_draft(
     request: DraftRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     _store = Store(db)
-    email = _store.get_email(request.email_id)
+    email = await _store.get_email(request.email_id)
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
     
-    prompts = _store.get_prompts()
+    prompts = await _store.get_prompts()
     auto_reply_prompt = prompts.get("auto_reply", "Default auto-reply prompt if not found.")
 
-    # Pass email's processed data to generate_draft for better context
-    draft_output = await llm_service.generate_draft(
-        email_body=email.body,
-        instructions=request.instructions,
-        prompt_template=auto_reply_prompt,
-        email_category=email.category,
-        email_action_items=email.action_items
-    )
-    
-    draft_data = {
-        "email_id": request.email_id,
-        "subject": f"Re: {email.subject}",
-        "body": draft_output.get("body", ""),
-        "suggested_follow_ups": draft_output.get("suggested_follow_ups", []),
-        "draft_metadata": draft_output.get("metadata", {})  # Map to draft_metadata column
-    }
-    saved_draft = _store.save_draft(draft_data)
+    precomputed = None
+    if request.instructions == DEFAULT_DRAFT_INSTRUCTIONS:
+        precomputed = await _store.pop_precomputed_draft(
+            request.email_id, prompt_version(auto_reply_prompt), request.instructions, email_version(email)
+        )
+    if precomputed:
+        draft_precomputer.hits += 1
+        draft_data = {
+            "email_id": precomputed.email_id,
+            "subject": precomputed.subject,
+            "body": precomputed.body,
+            "suggested_follow_ups": precomputed.suggested_follow_ups,
+            "draft_metadata": precomputed.draft_metadata,
+        }
+    else:
+        if draft_precomputer.enabled:
+            draft_precomputer.misses += 1
+        # Release the pooled connection while the draft is generated
+        await db.close()
+        draft_data = await build_draft_data(email, request.instructions, auto_reply_prompt)
+    saved_draft = await _store.save_draft(draft_data)
     
     # Return the saved draft data, ensuring it matches DraftResponse model
     return DraftResponse(
@@ -388,15 +838,15 @@ async def generate_draft(
     )
 
 @app.get("/drafts")
-async def get_drafts(db: Session = Depends(get_db)):
+async def get_drafts(db: AsyncSession = Depends(get_db)):
     _store = Store(db)
-    drafts = _store.get_drafts()
+    drafts = await _store.get_drafts()
     return drafts
 
 @app.get("/drafts/{draft_id}")
-async def get_draft(draft_id: int, db: Session = Depends(get_db)):
+async def get_draft(draft_id: int, db: AsyncSession = Depends(get_db)):
     _store = Store(db)
-    draft = _store.get_draft(draft_id)
+    draft = await _store.get_draft(draft_id)
     if not draft:
         raise HTTPException(status_code=404, detail="Draft not found")
     return draft
@@ -405,18 +855,18 @@ async def get_draft(draft_id: int, db: Session = Depends(get_db)):
 async def update_draft(
     draft_id: int,
     updates: DraftUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     _store = Store(db)
-    updated_draft = _store.update_draft(draft_id, updates.dict(exclude_unset=True))
+    updated_draft = await _store.update_draft(draft_id, updates.dict(exclude_unset=True))
     if not updated_draft:
         raise HTTPException(status_code=404, detail="Draft not found")
     return updated_draft
 
 @app.delete("/drafts/{draft_id}")
-async def delete_draft(draft_id: int, db: Session = Depends(get_db)):
+async def delete_draft(draft_id: int, db: AsyncSession = Depends(get_db)):
     _store = Store(db)
-    success = _store.delete_draft(draft_id)
+    success = await _store.delete_draft(draft_id)
     if not success:
         raise HTTPException(status_code=404, detail="Draft not found")
     return {"status": "deleted", "draft_id": draft_id}
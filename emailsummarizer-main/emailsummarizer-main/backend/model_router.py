@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Picks a Gemini model per call type and prompt size, and enforces a latency
+# SLO per call: if the primary model hasn't answered within
+# latency_slo_seconds the next model in the chain is started as a hedge
+# (first answer wins), and an error moves straight on to the next model.
+#
+# Override any route with LLM_MODEL_ROUTES, a JSON object keyed by call type:
+#   {"chat": {"models": ["gemini-2.0-flash", "gemini-2.0-flash-lite"], "latency_slo_seconds": 6}}
+
+PRIMARY_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-lite")
+SECONDARY_MODEL = os.getenv("GEMINI_SECONDARY_MODEL", "gemini-2.0-flash")
+# Filter configured models against the models list_models.py finds for the key
+LLM_DISCOVER_MODELS = os.getenv("LLM_DISCOVER_MODELS", "true").lower() in ("1", "true", "yes")
+
+DEFAULT_ROUTES: Dict[str, Dict] = {
+    # Short, high-volume triage calls: cheapest model first
+    "categorize": {"models": [PRIMARY_MODEL, SECONDARY_MODEL], "latency_slo_seconds": 3, "timeout_seconds": 15},
+    "action_items": {"models": [PRIMARY_MODEL, SECONDARY_MODEL], "latency_slo_seconds": 5, "timeout_seconds": 20},
+    "summarize": {
+        "models": [PRIMARY_MODEL, SECONDARY_MODEL], "latency_slo_seconds": 6, "timeout_seconds": 30,
+        # Long threads / bodies go to the larger model first
+        "large_input_chars": 12000, "large_models": [SECONDARY_MODEL, PRIMARY_MODEL],
+    },
+    "draft": {"models": [SECONDARY_MODEL, PRIMARY_MODEL], "latency_slo_seconds": 10, "timeout_seconds": 45},
+    # Chat prompts carry the multi-email inbox context
+    "chat": {"models": [SECONDARY_MODEL, PRIMARY_MODEL], "latency_slo_seconds": 10, "timeout_seconds": 45},
+    "default": {"models": [PRIMARY_MODEL, SECONDARY_MODEL], "latency_slo_seconds": 8, "timeout_seconds": 30},
+}
+
+
+def load_routes(config: Optional[str] = None) -> Dict[str, Dict]:
+    routes = {name: dict(route) for name, route in DEFAULT_ROUTES.items()}
+    config = config if config is not None else os.getenv("LLM_MODEL_ROUTES", "")
+    if config.strip():
+        try:
+            overrides = json.loads(config)
+            for name, route in overrides.items():
+                if not isinstance(route, dict) or not route.get("models", [None]):
+                    print(f"Warning: Ignoring invalid LLM_MODEL_ROUTES entry {name!r}")
+                    continue
+                routes.setdefault(name, dict(routes["default"])).update(route)
+        except (ValueError, AttributeError) as e:
+            print(f"Warning: Ignoring invalid LLM_MODEL_ROUTES: {e}")
+    return routes
+
+
+def _dedupe(models: List[str]) -> List[str]:
+    return list(dict.fromkeys(m for m in models if m))
+
+
+class ModelRouter:
+    def __init__(self, routes: Optional[Dict[str, Dict]] = None):
+        self.routes = routes or load_routes()
+        self.available: Optional[set] = None # Filled by seed_from_discovery()
+        self.calls: Dict[str, int] = defaultdict(int) # Results served, per model
+        self.failures: Dict[str, int] = defaultdict(int)
+        self.latency_total: Dict[str, float] = defaultdict(float)
+        self.hedges = 0
+        self.fallbacks = 0
+        self.timeouts = 0
+
+    def seed_from_discovery(self, discovered: List[str]):
+        self.available = set(discovered)
+        print(f"Model router: {len(self.available)} models available for generateContent.")
+
+    def _usable(self, models: List[str]) -> List[str]:
+        models = _dedupe(models)
+        if self.available:
+            usable = [m for m in models if m in self.available]
+            return usable or models # Misconfigured route: keep it rather than having nothing
+        return models
+
+    def route(self, call_type: str, input_chars: int) -> Tuple[List[str], Dict]:
+        """Returns (model chain, route settings) for a call."""
+        route = self.routes.get(call_type) or self.routes["default"]
+        models = route["models"]
+        if route.get("large_models") and input_chars >= route.get("large_input_chars", 0):
+            models = route["large_models"]
+        return self._usable(models), route
+
+    async def run(self, call_type: str, prompt: str,
+                  call_model: Callable[[str, str], Awaitable[str]]) -> Tuple[str, str]:
+        """Runs `call_model(model, prompt)` along the route's chain; returns (text, serving model)."""
+        models, route = self.route(call_type, len(prompt))
+        slo = route.get("latency_slo_seconds")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + route.get("timeout_seconds", 30)
+        pending: Dict[asyncio.Task, Tuple[str, float]] = {}
+        errors = []
+        next_model = 0
+        timed_out = False
+
+        def launch():
+            nonlocal next_model
+            model = models[next_model]
+            next_model += 1
+            pending[asyncio.create_task(call_model(model, prompt))] = (model, time.perf_counter())
+
+        launch()
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                can_hedge = slo is not None and next_model < len(models)
+                done, _ = await asyncio.wait(
+                    pending, timeout=min(remaining, slo) if can_hedge else remaining,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    if can_hedge:
+                        # Primary missed its latency SLO: race the next model against it
+                        self.hedges += 1
+                        launch()
+                    continue
+                for task in done:
+                    model, started = pending.pop(task)
+                    try:
+                        text = task.result()
+                    except Exception as e:
+                        self.failures[model] += 1
+                        errors.append(f"{model}: {e}")
+                        continue
+                    self.calls[model] += 1
+                    self.latency_total[model] += time.perf_counter() - started
+                    return text, model
+                if not pending and next_model < len(models):
+                    self.fallbacks += 1
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        if timed_out:
+            self.timeouts += 1
+            errors.append(f"no answer within {route.get('timeout_seconds', 30)}s")
+        raise RuntimeError(f"All models failed for {call_type}: " + "; ".join(errors))
+
+    def stats(self) -> Dict:
+        return {
+            "routes": {name: self._usable(route["models"]) for name, route in self.routes.items()},
+            "discovered_models": len(self.available) if self.available is not None else None,
+            "calls": dict(self.calls),
+            "failures": dict(self.failures),
+            "avg_latency_ms": {
+                model: round(self.latency_total[model] / count * 1000, 1)
+                for model, count in self.calls.items() if count
+            },
+            "hedges": self.hedges,
+            "fallbacks": self.fallbacks,
+            "timeouts": self.timeouts,
+        }
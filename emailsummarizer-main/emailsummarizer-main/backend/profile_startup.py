@@ -0,0 +1,95 @@
+"""Measures cold-start cost (import main + startup handlers) against a budget.
+
+    python profile_startup.py                # exits 1 if a budget is exceeded
+    python profile_startup.py --importtime   # also list the slowest imports
+
+Each measurement runs in a fresh interpreter against a throwaway SQLite
+database: the first boot takes the full create/seed path, later boots
+should take the version-checked fast path.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "800"))
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "250"))
+
+_PROBE = """
+import asyncio, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def boot():
+    began = time.perf_counter()
+    for handler in main.app.router.on_startup:
+        await handler()
+    booted = time.perf_counter()
+    for handler in main.app.router.on_shutdown:
+        await handler()
+    return booted - began
+
+startup = asyncio.run(boot())
+print(f"RESULT {(imported - start) * 1000:.1f} {startup * 1000:.1f}")
+"""
+
+
+def run_probe(database_url: str):
+    env = dict(os.environ, DATABASE_URL=database_url, GEMINI_API_KEY=os.getenv("GEMINI_API_KEY", ""))
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    line = next(l for l in output.splitlines() if l.startswith("RESULT "))
+    import_ms, startup_ms = (float(v) for v in line.split()[1:])
+    return import_ms, startup_ms
+
+
+def print_slowest_imports(limit: int = 15):
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR,
+        capture_output=True, text=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                rows.append((int(cumulative), name.rstrip()))
+    print("\nSlowest imports (cumulative ms):")
+    for cumulative, name in sorted(rows, reverse=True)[:limit]:
+        print(f"  {cumulative / 1000:8.1f}  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="warm boots to take the median of")
+    parser.add_argument("--importtime", action="store_true", help="list the slowest imports")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{os.path.join(tmp, 'profile.db')}"
+        cold_import, cold_startup = run_probe(database_url)
+        warm = [run_probe(database_url) for _ in range(args.runs)]
+
+    import_ms = statistics.median(r[0] for r in warm)
+    startup_ms = statistics.median(r[1] for r in warm)
+    print(f"First boot:  import {cold_import:7.1f} ms   startup {cold_startup:7.1f} ms")
+    print(f"Warm boots:  import {import_ms:7.1f} ms   startup {startup_ms:7.1f} ms  (median of {args.runs})")
+    print(f"Budgets:     import {IMPORT_BUDGET_MS:7.1f} ms   startup {STARTUP_BUDGET_MS:7.1f} ms")
+
+    if args.importtime:
+        print_slowest_imports()
+
+    over_budget = import_ms > IMPORT_BUDGET_MS or startup_ms > STARTUP_BUDGET_MS
+    if over_budget:
+        print("Startup budget exceeded.")
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
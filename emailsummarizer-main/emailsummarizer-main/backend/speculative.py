@@ -0,0 +1,69 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from classifier import normalize_category
+
+# Opt-in: after an email is triaged as actionable, generate a draft with the
+# default instructions while the LLM is otherwise idle, so the first click on
+# "Reply" is served from the cache instead of waiting on Gemini.
+
+SPECULATIVE_DRAFTS_ENABLED = os.getenv("SPECULATIVE_DRAFTS", "false").lower() in ("1", "true", "yes")
+SPECULATIVE_CATEGORIES = {"Important", "To-Do"}
+DEFAULT_DRAFT_INSTRUCTIONS = "Reply to this email"
+
+
+def prompt_version(template: Optional[str]) -> str:
+    """Identifies the auto_reply template a draft was generated with."""
+    return hashlib.sha256((template or "").encode("utf-8")).hexdigest()[:16]
+
+
+def email_version(email) -> str:
+    """Identifies the triage state a draft is built from (content, category, action items)."""
+    state = json.dumps([email.simhash, email.category, email.action_items], sort_keys=True, default=str)
+    return hashlib.sha256(state.encode("utf-8")).hexdigest()[:16]
+
+
+class DraftPrecomputer:
+    def __init__(self, enabled: bool = SPECULATIVE_DRAFTS_ENABLED):
+        self.enabled = enabled
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.pending: Set[str] = set()
+        self.generated = 0
+        self.hits = 0
+        self.misses = 0
+
+    def schedule(self, email_id: str, category: Optional[str]) -> bool:
+        if not self.enabled or normalize_category(category) not in SPECULATIVE_CATEGORIES:
+            return False
+        if email_id not in self.pending:
+            self.pending.add(email_id)
+            self.queue.put_nowait(email_id)
+        return True
+
+    async def run(self, generate: Callable[[str], Awaitable[None]], wait_until_idle: Callable[[], Awaitable[None]]):
+        """Worker loop: one speculative draft at a time, only when no foreground LLM call is running."""
+        while True:
+            email_id = await self.queue.get()
+            try:
+                await wait_until_idle()
+                await generate(email_id)
+                self.generated += 1
+            except Exception as e:
+                print(f"Speculative draft for email {email_id} failed: {e}")
+            finally:
+                self.pending.discard(email_id)
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "queued": len(self.pending),
+            "generated": self.generated,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+draft_precomputer = DraftPrecomputer()
@@ -1,77 +1,347 @@
-from typing import List, Dict, Any, Optional
-from sqlalchemy.orm import Session
-from database import Email, Prompt, Draft # Import the models we defined
+from datetime import datetime
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+from sqlalchemy import select, delete, update, func, and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from database import Email, EmailBodyCold, EmailThread, Prompt, Draft, PrecomputedDraft, ActionItem, ChatSession, ChatMessage # Import the models we defined
+from events import broadcaster
+from gmail_writeback import gmail_writeback
+from action_items import build_action_item_rows
+from dedup import hamming_distance, NEAR_DUPLICATE_MAX_DISTANCE
+from cold_storage import compress_text, decompress_text
+
+def _email_event_name(updates: Dict) -> str:
+    if "processing_error" in updates:
+        return "email.failed"
+    if updates.get("processed"):
+        return "email.processed"
+    return "email.updated"
 
 class Store:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def get_emails(self) -> List[Email]:
-        return self.db.query(Email).all()
+    async def get_emails(self) -> List[Email]:
+        # Archived emails come back with body=None; use load_cold_bodies() where the body is needed
+        result = await self.db.execute(select(Email))
+        return result.scalars().all()
+
+    async def get_email(self, email_id: str) -> Optional[Email]:
+        email = await self.db.get(Email, email_id)
+        if email:
+            await self.load_cold_bodies([email])
+        return email
+
+    async def load_cold_bodies(self, emails: List[Email]) -> List[Email]:
+        """Fills in bodies of archived emails from the cold table (one query for the batch)."""
+        archived = {e.id: e for e in emails if e.archived and e.body is None}
+        if archived:
+            result = await self.db.execute(select(EmailBodyCold).filter(EmailBodyCold.email_id.in_(list(archived))))
+            for cold in result.scalars().all():
+                # Committed value, so the decompressed body isn't written back to the hot table
+                set_committed_value(archived[cold.email_id], "body", decompress_text(cold.codec, cold.body))
+        return emails
 
-    def get_email(self, email_id: str) -> Optional[Email]:
-        return self.db.query(Email).filter(Email.id == email_id).first()
+    async def compact_cold_storage(self, older_than: datetime, batch_size: int) -> Dict[str, int]:
+        """Moves up to batch_size bodies of emails older than `older_than` into the compressed cold table."""
+        result = await self.db.execute(
+            select(Email)
+            .filter(Email.timestamp < older_than, Email.body.isnot(None), or_(Email.archived.is_(None), Email.archived.is_(False)))
+            .order_by(Email.timestamp)
+            .limit(batch_size)
+        )
+        stats = {"archived": 0, "original_bytes": 0, "compressed_bytes": 0}
+        for email in result.scalars().all():
+            codec, data = compress_text(email.body)
+            original_size = len(email.body.encode("utf-8"))
+            await self.db.merge(EmailBodyCold(
+                email_id=email.id, codec=codec, body=data,
+                original_size=original_size, compressed_size=len(data),
+            ))
+            email.body = None
+            email.archived = True
+            stats["archived"] += 1
+            stats["original_bytes"] += original_size
+            stats["compressed_bytes"] += len(data)
+        await self.db.commit()
+        return stats
 
-    def add_emails(self, new_emails: List[Dict]):
+    async def storage_stats(self) -> Dict[str, Any]:
+        hot = (await self.db.execute(
+            select(func.count(Email.id), func.coalesce(func.sum(func.length(Email.body)), 0))
+            .filter(or_(Email.archived.is_(None), Email.archived.is_(False)))
+        )).one()
+        cold = (await self.db.execute(
+            select(
+                func.count(EmailBodyCold.email_id),
+                func.coalesce(func.sum(EmailBodyCold.original_size), 0),
+                func.coalesce(func.sum(EmailBodyCold.compressed_size), 0),
+            )
+        )).one()
+        return {
+            "hot_emails": hot[0],
+            "hot_body_chars": hot[1],
+            "cold_emails": cold[0],
+            "cold_original_bytes": cold[1],
+            "cold_compressed_bytes": cold[2],
+            "cold_compression_ratio": round(cold[1] / cold[2], 2) if cold[2] else None,
+        }
+
+    async def add_emails(self, new_emails: List[Dict]) -> List[str]:
+        """Inserts emails whose ids aren't stored yet; returns the inserted ids."""
+        ids = [email_data["id"] for email_data in new_emails]
+        result = await self.db.execute(select(Email.id).filter(Email.id.in_(ids)))
+        existing_ids = set(result.scalars().all())
+        inserted = []
         for email_data in new_emails:
-            existing_email = self.db.query(Email).filter(Email.id == email_data["id"]).first()
-            if not existing_email:
+            if email_data["id"] not in existing_ids:
                 email = Email(**email_data)
                 self.db.add(email)
-        self.db.commit()
+                existing_ids.add(email_data["id"])
+                inserted.append(email_data["id"])
+                if email_data.get("action_items"):
+                    self._add_action_item_rows(email)
+        await self.db.commit()
+        return inserted
+
+    async def get_emails_page(self, after_id: Optional[str], limit: int) -> List[Email]:
+        """Keyset page ordered by id, with archived bodies loaded; used by the NDJSON export."""
+        query = select(Email).order_by(Email.id).limit(limit)
+        if after_id is not None:
+            query = query.filter(Email.id > after_id)
+        result = await self.db.execute(query)
+        return await self.load_cold_bodies(result.scalars().all())
 
-    def update_email(self, email_id: str, updates: Dict) -> Optional[Email]:
-        email = self.db.query(Email).filter(Email.id == email_id).first()
+    async def update_email(self, email_id: str, updates: Dict) -> Optional[Email]:
+        email = await self.db.get(Email, email_id)
         if email:
             for key, value in updates.items():
                 setattr(email, key, value)
-            self.db.commit()
-            self.db.refresh(email) # Refresh the object to get latest state from DB
+            if "action_items" in updates:
+                # Keep the normalized action_items table in step with the JSON column
+                await self.db.execute(delete(ActionItem).where(ActionItem.email_id == email_id))
+                self._add_action_item_rows(email)
+            await self.db.commit()
+            await self.db.refresh(email) # Refresh the object to get latest state from DB
+            # Push only the changed fields so clients can apply a delta
+            broadcaster.publish(_email_event_name(updates), {"id": email_id, **updates})
+            gmail_writeback.record(email, updates)
             return email
         return None
 
-    def get_prompts(self) -> Dict[str, str]:
-        prompts = self.db.query(Prompt).all()
-        return {p.name: p.template for p in prompts}
+    def _add_action_item_rows(self, email: Email):
+        rows = build_action_item_rows(email.id, email.action_items, email.timestamp)
+        self.db.add_all([ActionItem(**row) for row in rows])
+
+    async def get_action_items(
+        self,
+        before: Optional[datetime] = None,
+        after: Optional[datetime] = None,
+        include_undated: bool = False,
+        email_ids: Optional[List[str]] = None,
+    ) -> List[Any]:
+        """Returns (ActionItem, subject, sender) rows ordered by deadline, undated last."""
+        query = select(ActionItem, Email.subject, Email.sender).join(Email, Email.id == ActionItem.email_id)
+        window = []
+        if before:
+            window.append(ActionItem.deadline < before)
+        if after:
+            window.append(ActionItem.deadline >= after)
+        dated = and_(ActionItem.deadline.isnot(None), *window)
+        query = query.filter(or_(dated, ActionItem.deadline.is_(None)) if include_undated else dated)
+        if email_ids is not None:
+            query = query.filter(ActionItem.email_id.in_(email_ids))
+        query = query.order_by(ActionItem.deadline.is_(None), ActionItem.deadline, ActionItem.id)
+        result = await self.db.execute(query)
+        return result.all()
+
+    async def backfill_action_items(self) -> int:
+        """Populates action_items rows for emails processed before the table existed."""
+        indexed = select(ActionItem.email_id).distinct()
+        result = await self.db.execute(
+            select(Email).filter(Email.action_items.isnot(None), Email.id.notin_(indexed))
+        )
+        emails = [e for e in result.scalars().all() if e.action_items]
+        for email in emails:
+            self._add_action_item_rows(email)
+        await self.db.commit()
+        return len(emails)
+
+    async def find_near_duplicate(self, email: Email, fingerprint: int, limit: int = 200) -> Optional[Any]:
+        """Closest already-processed email from the same sender within NEAR_DUPLICATE_MAX_DISTANCE bits.
+
+        Returns an (id, simhash, number_digest, category, summary, thread_id) row; bodies aren't loaded.
+        """
+        result = await self.db.execute(
+            select(Email.id, Email.simhash, Email.number_digest, Email.category, Email.summary, Email.thread_id)
+            .filter(
+                Email.sender == email.sender,
+                Email.id != email.id,
+                Email.processed.is_(True),
+                Email.simhash.isnot(None),
+                Email.category.isnot(None),
+                # A canned category from a model outage isn't worth copying
+                or_(Email.category_source.is_(None), Email.category_source != "fallback"),
+            )
+            .order_by(Email.timestamp.desc())
+            .limit(limit)
+        )
+        best, best_distance = None, NEAR_DUPLICATE_MAX_DISTANCE + 1
+        for candidate in result.all():
+            distance = hamming_distance(candidate.simhash, fingerprint)
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        return best
+
+    async def stream_labelled_emails(self, body_chars: int) -> AsyncIterator[Any]:
+        """Yields (sender, subject, body prefix, headers, category) for emails not labelled by the local classifier."""
+        result = await self.db.stream(
+            select(Email.sender, Email.subject, func.substr(Email.body, 1, body_chars), Email.headers, Email.category)
+            .filter(Email.category.isnot(None), or_(Email.category_source.is_(None), Email.category_source == "llm"))
+        )
+        async for row in result:
+            yield row
+
+    async def get_thread(self, thread_id: str) -> Optional[EmailThread]:
+        return await self.db.get(EmailThread, thread_id)
+
+    async def save_thread(self, thread_id: str, updates: Dict) -> EmailThread:
+        for attempt in range(2):
+            thread = await self.db.get(EmailThread, thread_id)
+            if not thread:
+                thread = EmailThread(id=thread_id, message_count=0)
+                self.db.add(thread)
+            for key, value in updates.items():
+                setattr(thread, key, value)
+            try:
+                await self.db.commit()
+                return thread
+            except IntegrityError:
+                # Another writer created the thread between our read and insert; update theirs
+                await self.db.rollback()
+                if attempt:
+                    raise
+
+    async def get_thread_messages(self, thread_id: str, limit: int) -> Tuple[List[Email], int]:
+        """Newest `limit` processed messages of a thread, oldest first with bodies loaded, plus the total count."""
+        filters = (Email.thread_id == thread_id, Email.processed.is_(True))
+        total = (await self.db.execute(select(func.count(Email.id)).filter(*filters))).scalar()
+        result = await self.db.execute(
+            select(Email).filter(*filters).order_by(Email.timestamp.desc()).limit(limit)
+        )
+        messages = list(reversed(result.scalars().all()))
+        return await self.load_cold_bodies(messages), total
+
+    async def get_chat_session(self, session_id: str) -> Optional[ChatSession]:
+        return await self.db.get(ChatSession, session_id)
+
+    async def create_chat_session(self, session_id: str) -> ChatSession:
+        session = ChatSession(id=session_id)
+        self.db.add(session)
+        await self.db.commit()
+        return session
+
+    async def get_unfolded_messages(self, session_id: str) -> List[ChatMessage]:
+        result = await self.db.execute(
+            select(ChatMessage)
+            .filter(ChatMessage.session_id == session_id, ChatMessage.folded.is_(False))
+            .order_by(ChatMessage.id)
+        )
+        return result.scalars().all()
+
+    async def add_chat_messages(self, session_id: str, messages: List[Dict]) -> List[ChatMessage]:
+        rows = [ChatMessage(session_id=session_id, role=m["role"], content=m["content"]) for m in messages]
+        self.db.add_all(rows)
+        await self.db.commit()
+        return rows
+
+    async def fold_chat_messages(self, session_id: str, message_ids: List[int], summary: str):
+        """Replaces the given messages with the session's new running summary."""
+        await self.db.execute(
+            update(ChatMessage).where(ChatMessage.id.in_(message_ids)).values(folded=True)
+        )
+        await self.db.execute(
+            update(ChatSession).where(ChatSession.id == session_id)
+            .values(summary=summary, updated_at=datetime.utcnow())
+        )
+        await self.db.commit()
 
-    def update_prompts(self, new_prompts: Dict) -> Dict[str, str]:
+    async def get_prompts(self) -> Dict[str, str]:
+        result = await self.db.execute(select(Prompt))
+        return {p.name: p.template for p in result.scalars().all()}
+
+    async def update_prompts(self, new_prompts: Dict) -> Dict[str, str]:
         for prompt_name, prompt_template in new_prompts.items():
-            prompt = self.db.query(Prompt).filter(Prompt.name == prompt_name).first()
+            result = await self.db.execute(select(Prompt).filter(Prompt.name == prompt_name))
+            prompt = result.scalars().first()
             if prompt:
+                if prompt_name == "auto_reply" and prompt.template != prompt_template:
+                    # Precomputed drafts were generated with the old template
+                    await self.db.execute(delete(PrecomputedDraft))
                 prompt.template = prompt_template
             else:
                 new_prompt = Prompt(name=prompt_name, template=prompt_template)
                 self.db.add(new_prompt)
-        self.db.commit()
-        return self.get_prompts()
+        await self.db.commit()
+        return await self.get_prompts()
 
-    def get_drafts(self) -> List[Draft]:
-        return self.db.query(Draft).all()
+    async def get_drafts(self) -> List[Draft]:
+        result = await self.db.execute(select(Draft))
+        return result.scalars().all()
 
-    def save_draft(self, draft_data: Dict) -> Draft:
+    async def save_draft(self, draft_data: Dict) -> Draft:
         draft = Draft(**draft_data)
         self.db.add(draft)
-        self.db.commit()
-        self.db.refresh(draft)
+        await self.db.commit()
+        await self.db.refresh(draft)
+        broadcaster.publish("draft.created", {
+            "id": draft.id,
+            "email_id": draft.email_id,
+            "subject": draft.subject,
+            "created_at": draft.created_at,
+        })
+        return draft
+
+    async def save_precomputed_draft(self, draft_data: Dict) -> PrecomputedDraft:
+        draft = await self.db.merge(PrecomputedDraft(**draft_data))
+        await self.db.commit()
         return draft
 
-    def update_draft(self, draft_id: int, updates: Dict) -> Optional[Draft]:
-        draft = self.db.query(Draft).filter(Draft.id == draft_id).first()
+    async def pop_precomputed_draft(self, email_id: str, prompt_version: str, instructions: str,
+                                    email_version: str) -> Optional[PrecomputedDraft]:
+        """Removes and returns the cached draft for an email if it still matches the template, instructions and email state."""
+        draft = await self.db.get(PrecomputedDraft, email_id)
+        if not draft:
+            return None
+        await self.db.delete(draft)
+        await self.db.commit()
+        if draft.prompt_version != prompt_version or draft.instructions != instructions \
+                or draft.email_version != email_version:
+            return None
+        return draft
+
+    async def delete_precomputed_draft(self, email_id: str):
+        await self.db.execute(delete(PrecomputedDraft).where(PrecomputedDraft.email_id == email_id))
+        await self.db.commit()
+
+    async def update_draft(self, draft_id: int, updates: Dict) -> Optional[Draft]:
+        draft = await self.db.get(Draft, draft_id)
         if draft:
             for key, value in updates.items():
                 setattr(draft, key, value)
-            self.db.commit()
-            self.db.refresh(draft)
+            await self.db.commit()
+            await self.db.refresh(draft)
             return draft
         return None
 
-    def get_draft(self, draft_id: int) -> Optional[Draft]:
-        return self.db.query(Draft).filter(Draft.id == draft_id).first()
+    async def get_draft(self, draft_id: int) -> Optional[Draft]:
+        return await self.db.get(Draft, draft_id)
 
-    def delete_draft(self, draft_id: int) -> bool:
-        draft = self.db.query(Draft).filter(Draft.id == draft_id).first()
+    async def delete_draft(self, draft_id: int) -> bool:
+        draft = await self.db.get(Draft, draft_id)
         if draft:
-            self.db.delete(draft)
-            self.db.commit()
+            await self.db.delete(draft)
+            await self.db.commit()
             return True
         return False
@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from action_items import build_action_item_rows, parse_deadline
+
+REFERENCE = datetime(2025, 11, 3, 9, 0) # A Monday
+
+
+def test_iso_datetime():
+    assert parse_deadline("2025-11-05T14:30", REFERENCE) == datetime(2025, 11, 5, 14, 30)
+
+
+def test_iso_24_00_is_end_of_day():
+    assert parse_deadline("2025-11-05T24:00", REFERENCE) == datetime(2025, 11, 5, 23, 59)
+
+
+def test_out_of_range_iso_time_is_not_a_deadline():
+    assert parse_deadline("2025-11-05T25:00", REFERENCE) is None
+    assert parse_deadline("2025-11-05T10:75", REFERENCE) is None
+
+
+def test_out_of_range_clock_time_is_not_a_deadline():
+    assert parse_deadline("by 5:75pm friday", REFERENCE) is None
+    assert parse_deadline("by 5:30pm friday", REFERENCE) == datetime(2025, 11, 7, 17, 30)
+
+
+def test_invalid_date_is_not_a_deadline():
+    assert parse_deadline("2025-02-30", REFERENCE) is None
+
+
+def test_rows_survive_bad_deadlines():
+    rows = build_action_item_rows("1", [{"task": "Ship it", "deadline": "2025-11-05T25:00"}], REFERENCE)
+    assert rows == [{"email_id": "1", "task": "Ship it", "deadline_text": "2025-11-05T25:00", "deadline": None}]
+
+
+def test_words_starting_with_a_month_are_not_dates():
+    for task in ["Make 5 decisions on hiring", "Review 3 marketing plans",
+                 "Prepare 4 junior hires", "Finish 20 mayonnaise"]:
+        assert parse_deadline(task, REFERENCE, in_task=True) is None, task
+
+
+def test_month_names_and_abbreviations():
+    assert parse_deadline("Dec 5", REFERENCE) == datetime(2025, 12, 5, 23, 59)
+    assert parse_deadline("5th of December", REFERENCE) == datetime(2025, 12, 5, 23, 59)
+    assert parse_deadline("Sept. 3, 2026", REFERENCE) == datetime(2026, 9, 3, 23, 59)
+
+
+def test_fraction_in_task_text_is_not_a_date():
+    assert parse_deadline("Send the 1/2 done draft", REFERENCE, in_task=True) is None
+    assert parse_deadline("Send the draft by 12/1", REFERENCE, in_task=True) == datetime(2025, 12, 1, 23, 59)
+    assert parse_deadline("Send the draft 12/1/2025", REFERENCE, in_task=True) == datetime(2025, 12, 1, 23, 59)
+    # A deadline field is already known to be a date
+    assert parse_deadline("12/1", REFERENCE) == datetime(2025, 12, 1, 23, 59)
+
+
+def test_rows_from_plain_string_tasks():
+    rows = build_action_item_rows("1", ["Make 5 decisions on hiring", "Send the 1/2 done draft",
+                                        "Renew the lease by December 1st"], REFERENCE)
+    assert [row["deadline"] for row in rows] == [None, None, datetime(2025, 12, 1, 23, 59)]
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from chat_sessions import CHAT_HISTORY_TOKEN_BUDGET, ChatSessionManager, ChatSessionState
+
+
+class FakeStore:
+    def __init__(self):
+        self.folds = []
+
+    async def fold_chat_messages(self, session_id, message_ids, summary):
+        self.folds.append((session_id, message_ids, summary))
+
+
+def long_session():
+    content = "x" * (CHAT_HISTORY_TOKEN_BUDGET * 4)
+    return ChatSessionState("s1", None, [{"id": i, "role": "user", "content": content} for i in range(8)])
+
+
+def test_failed_summary_keeps_the_turns():
+    async def summarize(summary, messages):
+        raise RuntimeError("no model")
+
+    store, state = FakeStore(), long_session()
+    with pytest.raises(RuntimeError):
+        asyncio.run(ChatSessionManager().compact(store, state, summarize))
+    assert store.folds == [] and len(state.messages) == 8 and state.summary is None
+
+
+def test_concurrent_compactions_fold_once():
+    calls = []
+
+    async def summarize(summary, messages):
+        calls.append(len(messages))
+        await asyncio.sleep(0.01)
+        return "summary"
+
+    async def run():
+        manager, store, state = ChatSessionManager(), FakeStore(), long_session()
+        results = await asyncio.gather(*(manager.compact(store, state, summarize) for _ in range(2)))
+        return results, store, state
+
+    results, store, state = asyncio.run(run())
+    assert sorted(results) == [False, True]
+    assert calls == [4] and len(store.folds) == 1 and state.summary == "summary"
@@ -0,0 +1,50 @@
+import random
+
+from classifier import CATEGORIES, LOCAL_CLASSIFIER_MIN_SAMPLES, LocalClassifier
+
+WORDS = (
+    "alpha beta gamma delta report meeting invoice sale offer weekly update "
+    "project deadline review team lunch budget news digest promo"
+).split()
+TOPICS = {
+    "Important": "contract signature legal board urgent approval",
+    "Newsletter": "digest weekly edition unsubscribe articles roundup",
+    "Spam": "winner prize casino lottery claim free",
+    "To-Do": "please complete submit form task assigned",
+}
+
+
+def random_email(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(30, 300)))
+
+
+def topic_email(rng, category):
+    vocabulary = TOPICS[category].split()
+    return " ".join(rng.choice(vocabulary) for _ in range(rng.randint(20, 60)))
+
+
+def test_untrained_model_escalates():
+    model = LocalClassifier()
+    assert model.classify("someone@example.com", "Hello", "Quarterly budget review") is None
+    assert model.escalations == 1
+
+
+def test_model_trained_on_random_labels_escalates():
+    rng = random.Random(1)
+    model = LocalClassifier()
+    for i in range(LOCAL_CLASSIFIER_MIN_SAMPLES * 4):
+        model.learn(f"u{i}@x{i}.com", random_email(rng), random_email(rng), None, rng.choice(CATEGORIES))
+    answered = [
+        model.classify(f"z{i}@q.com", random_email(rng), random_email(rng)) for i in range(50)
+    ]
+    assert answered == [None] * 50
+
+
+def test_model_that_agrees_with_the_llm_answers_locally():
+    rng = random.Random(2)
+    model = LocalClassifier()
+    for i in range(LOCAL_CLASSIFIER_MIN_SAMPLES * 4):
+        category = CATEGORIES[i % len(CATEGORIES)]
+        model.learn(f"u{i}@x{i}.com", "", topic_email(rng, category), None, category)
+    assert model.agreement_rate() > 0.9
+    assert model.classify("new@sender.com", "", topic_email(rng, "Spam")) == "Spam"
@@ -0,0 +1,15 @@
+import pytest
+
+from email_io import record_to_email_data
+
+
+def test_bad_field_types_are_rejected_per_record():
+    for record in [{"id": "x1", "read": "maybe"}, {"id": "x1", "subject": {"a": 1}},
+                   {"id": "x1", "headers": ["List-Id"]}, {"id": "x1", "action_items": 3}]:
+        with pytest.raises(ValueError):
+            record_to_email_data(record)
+
+
+def test_loose_scalar_types_are_coerced():
+    data = record_to_email_data({"id": 7, "read": "true", "processed": 0, "sender": 42, "summary": None})
+    assert (data["id"], data["read"], data["processed"], data["sender"], data["summary"]) == ("7", True, False, "42", None)
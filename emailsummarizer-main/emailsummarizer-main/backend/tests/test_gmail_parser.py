@@ -0,0 +1,38 @@
+from gmail_parser import strip_quoted_reply, strip_signature
+
+
+def test_rfc_delimiter_near_end_strips_signature():
+    assert strip_signature("Hi team,\nShipping Friday.\n-- \nBob\nACME Corp") == "Hi team,\nShipping Friday."
+
+
+def test_bare_dashes_are_a_divider_not_a_signature():
+    text = "Agenda\n--\nItem one\n--\nItem two"
+    assert strip_signature(text) == text
+
+
+def test_delimiter_far_from_end_is_kept():
+    text = "Intro\n-- \n" + "\n".join(f"line {i}" for i in range(15))
+    assert strip_signature(text) == text
+
+
+def test_mobile_footer_is_stripped():
+    assert strip_signature("Sounds good\nSent from my iPhone") == "Sounds good"
+
+
+def test_mobile_footer_mid_body_is_kept():
+    text = "Quick update\nSent from my iPhone, so excuse typos\n" + "\n".join(f"point {i}" for i in range(15))
+    assert strip_signature(text) == text
+
+
+def test_forwarded_message_is_kept():
+    text = (
+        "FYI, see below\n\n---------- Forwarded message ----------\nFrom: Alice <a@example.com>\n"
+        "Subject: Budget\n\nThe budget is approved.\n> quoted in the original"
+    )
+    assert strip_quoted_reply(text) == text
+
+
+def test_reply_quotes_are_stripped():
+    text = "Sounds good.\n\nOn Mon, Nov 3, 2025 at 9:00 AM Alice <a@example.com> wrote:\n> Can we meet?"
+    assert strip_quoted_reply(text) == "Sounds good."
+    assert strip_quoted_reply("Agreed.\n-----Original Message-----\nFrom: Bob") == "Agreed."
@@ -14,6 +14,7 @@ const AgentChat = ({ emailId: propEmailId }) => {
         { role: 'agent', content: 'Hello! I\'m your Email Agent. I can help you:\n\n• Summarize emails\n• Find action items\n• Answer questions about your inbox\n• Draft replies\n\nWhat would you like to know?' }
     ]);
     const [input, setInput] = useState('');
+    const [sessionId, setSessionId] = useState(null); // History lives server-side; we only send new queries
     const [loading, setLoading] = useState(false);
     const [showDraftConfirmation, setShowDraftConfirmation] = useState(false);
     const [pendingDraftInstructions, setPendingDraftInstructions] = useState('');
@@ -53,10 +54,11 @@ const AgentChat = ({ emailId: propEmailId }) => {
                 body: JSON.stringify({
                     query: userMsg.content,
                     email_id: emailId,
-                    history: messages
+                    session_id: sessionId
                 })
             });
             const data = await res.json();
+            setSessionId(data.session_id);
             setMessages(prev => [...prev, { role: 'agent', content: data.response }]);
         } catch (e) {
             setMessages(prev => [...prev, { role: 'agent', content: '❌ Sorry, I encountered an error. Please try again.' }]);
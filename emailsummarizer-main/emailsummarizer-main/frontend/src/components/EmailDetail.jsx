@@ -1,14 +1,19 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import DraftEditor from './DraftEditor';
 import { API_BASE_URL } from '../config';
 
+// If no processing event arrives within this long, fetch the result instead
+const PROCESSING_TIMEOUT_MS = 60000;
+
 const EmailDetail = () => {
     const { emailId } = useParams(); // Get emailId from URL
     const navigate = useNavigate();
     const [email, setEmail] = useState(null);
     const [processing, setProcessing] = useState(false);
     const [showDraft, setShowDraft] = useState(false);
+    const processingRef = useRef(false);
+    processingRef.current = processing;
 
     useEffect(() => {
         if (emailId) {
@@ -19,6 +24,49 @@ const EmailDetail = () => {
         }
     }, [emailId]);
 
+    useEffect(() => {
+        if (!emailId) return;
+        const source = new EventSource(`${API_BASE_URL}/events`);
+        const applyDelta = (event) => {
+            const delta = JSON.parse(event.data);
+            if (delta.id !== emailId) return;
+            setEmail(prev => (prev ? { ...prev, ...delta } : prev));
+            if (event.type !== 'email.updated') {
+                setProcessing(false);
+            }
+        };
+        source.addEventListener('email.processed', applyDelta);
+        source.addEventListener('email.failed', applyDelta);
+        source.addEventListener('email.updated', applyDelta);
+        source.onerror = (error) => {
+            console.error('EmailDetail: event stream error:', error);
+            // The result event may have been missed while the stream was down
+            if (processingRef.current) {
+                refreshAfterProcessing();
+            }
+        };
+        return () => source.close();
+    }, [emailId]);
+
+    useEffect(() => {
+        if (!processing) return;
+        const timer = setTimeout(refreshAfterProcessing, PROCESSING_TIMEOUT_MS);
+        return () => clearTimeout(timer);
+    }, [processing]);
+
+    const refreshAfterProcessing = async () => {
+        try {
+            const response = await fetch(`${API_BASE_URL}/emails/${emailId}`);
+            if (response.ok) {
+                setEmail(await response.json());
+            }
+        } catch (error) {
+            console.error('EmailDetail: Error refreshing email:', error);
+        } finally {
+            setProcessing(false);
+        }
+    };
+
     const fetchEmailDetail = async () => {
         try {
             const url = `${API_BASE_URL}/emails/${emailId}`;
@@ -32,12 +80,28 @@ const EmailDetail = () => {
             const data = await response.json();
             console.log('EmailDetail: Received data:', data);
             setEmail(data);
+            if (!data.read) {
+                markAsRead(data.id);
+            }
         } catch (error) {
             console.error('EmailDetail: Error fetching email detail:', error);
             navigate('/inbox'); // Navigate back to inbox on error
         }
     };
 
+    const markAsRead = async (id) => {
+        try {
+            // The `email.updated` event updates the inbox list
+            await fetch(`${API_BASE_URL}/emails/${id}`, {
+                method: 'PATCH',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ read: true })
+            });
+        } catch (error) {
+            console.error('EmailDetail: Error marking email as read:', error);
+        }
+    };
+
     if (!email) {
         return <div className="card">Loading email...</div>;
     }
@@ -48,8 +112,8 @@ const EmailDetail = () => {
             await fetch(`${API_BASE_URL}/emails/${email.id}/process`, {
                 method: 'POST'
             });
-            fetchEmailDetail();
-            setProcessing(false);
+            // The event stream clears `processing` once the result arrives; the
+            // timeout above and the stream's onerror fall back to refetching
         } catch (error) {
             console.error('EmailDetail: Error processing email:', error);
             setProcessing(false);
@@ -12,6 +12,22 @@ const Inbox = () => {
         fetchEmails();
     }, []);
 
+    // Apply processing results pushed by the backend instead of refetching the list
+    useEffect(() => {
+        const source = new EventSource(`${API_BASE_URL}/events`);
+        const applyDelta = (event) => {
+            const delta = JSON.parse(event.data);
+            setEmails(prev => prev.map(email =>
+                email.id === delta.id ? { ...email, ...delta } : email
+            ));
+        };
+        source.addEventListener('email.processed', applyDelta);
+        source.addEventListener('email.failed', applyDelta);
+        source.addEventListener('email.updated', applyDelta);
+        source.onerror = (error) => console.error('Inbox: event stream error:', error);
+        return () => source.close();
+    }, []);
+
     const fetchEmails = async () => {
         console.log('Attempting to fetch emails...');
         try {